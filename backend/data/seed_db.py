@@ -16,6 +16,7 @@ from models.db_models import (
     Supplier, SupplyChainEvent, DisruptionLog,
     InventoryPosition, MacroRiskSignal
 )
+from services.rolling_aggregates import rebuild_event_aggregates
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "generated")
 _IS_SQLITE = DATABASE_URL.startswith("sqlite")
@@ -134,6 +135,10 @@ def seed():
         db.commit()
         print(f"  ✓ Inserted {len(events_data)} supply chain events")
 
+        # Rolling event aggregates are maintained on ingest; rebuild them for the bulk load
+        buckets = rebuild_event_aggregates(db)
+        print(f"  ✓ Rebuilt {buckets} rolling event aggregate buckets")
+
         # Disruptions
         disruptions_data = load_json("disruptions.json")
         for d in disruptions_data:
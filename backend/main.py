@@ -1,10 +1,21 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from database import engine, Base
-from routers import tree, disruptions, predict, compare, simulate, suppliers
+from routers import tree, disruptions, predict, compare, simulate, suppliers, ingest
+from services.broadcast_backend import broadcast_backend
+from services.scheduler import scheduler
+from services.tree_registry import registry
 
-# Create all DB tables on startup
+# Create all DB tables on startup; create_all skips existing tables, so
+# indexes added later are created separately
 Base.metadata.create_all(bind=engine)
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+# Load the configured metric tree (METRIC_TREE_SOURCE) and watch it for changes
+registry.refresh()
+registry.start_watcher()
 
 app = FastAPI(
     title="ChipTrace AI API",
@@ -21,6 +32,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Background evaluation: scores the tree on a cadence (and after ingest or a
+# tree reload), persists snapshots and pushes alerts and tree deltas to
+# dashboards of every worker through the broadcast backend
+registry.add_listener(lambda tree: scheduler.trigger())
+scheduler.add_publisher(broadcast_backend.publish)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await broadcast_backend.start()
+    scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await scheduler.stop()
+    await broadcast_backend.stop()
+
+
 # Register routers
 app.include_router(tree.router, prefix="/api/metric-tree", tags=["Metric Tree"])
 app.include_router(disruptions.router, prefix="/api/disruptions", tags=["Disruptions"])
@@ -28,6 +58,7 @@ app.include_router(predict.router, prefix="/api/predict", tags=["Predictions"])
 app.include_router(compare.router, prefix="/api/compare", tags=["Compare"])
 app.include_router(simulate.router, prefix="/api/simulate", tags=["Simulate"])
 app.include_router(suppliers.router, prefix="/api/suppliers", tags=["Suppliers"])
+app.include_router(ingest.router, prefix="/api/ingest", tags=["Ingest"])
 
 
 @app.get("/")
@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from sqlalchemy import (
     Column, String, Integer, Float, Boolean,
-    DateTime, Date, Text, ForeignKey, ARRAY
+    DateTime, Date, Text, ForeignKey, ARRAY, Index, LargeBinary
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
@@ -68,6 +68,11 @@ class MetricSnapshot(Base):
     parent_node_id = Column(String(100), nullable=True)
     evaluated_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # latest-per-node lookups and per-node history scans
+        Index("ix_metric_snapshots_node_evaluated", "node_id", "evaluated_at"),
+    )
+
 
 class DisruptionLog(Base):
     __tablename__ = "disruption_log"
@@ -110,3 +115,88 @@ class MacroRiskSignal(Base):
     signal_date = Column(Date)
     source = Column(String(200))
     resolved = Column(Boolean, default=False)
+
+
+class MetricTreeDefinition(Base):
+    __tablename__ = "metric_tree_definitions"
+
+    definition_id = Column(String, primary_key=True, default=gen_uuid)
+    program = Column(String(100), nullable=False)   # OEM program the tree applies to
+    tree_hash = Column(String(64), nullable=False)  # content hash of the definition
+    definition = Column(Text, nullable=False)       # JSON: node_id → {label, parent, weight, leaf}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MetricTreeVersion(Base):
+    __tablename__ = "metric_tree_versions"
+
+    tree_hash = Column(String(64), primary_key=True)  # CompiledTree.version
+    node_ids = Column(Text, nullable=False)         # JSON list: column order of packed score vectors
+    definition = Column(Text, nullable=False)       # JSON: node_id → {label, parent, weight, leaf}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MetricSnapshotFrame(Base):
+    __tablename__ = "metric_snapshot_frames"
+
+    frame_id = Column(Integer, primary_key=True, autoincrement=True)
+    tree_hash = Column(String(64), ForeignKey("metric_tree_versions.tree_hash"), nullable=False)
+    evaluated_at = Column(DateTime, nullable=False)
+    scores = Column(LargeBinary, nullable=False)    # float32 little-endian, one per node in node_ids order
+
+    __table_args__ = (
+        Index("ix_metric_snapshot_frames_evaluated", "evaluated_at"),
+    )
+
+
+class MetricSnapshotRollup(Base):
+    __tablename__ = "metric_snapshot_rollups"
+
+    rollup_id = Column(Integer, primary_key=True, autoincrement=True)
+    tier = Column(String(10), nullable=False)       # hour | day
+    bucket_start = Column(DateTime, nullable=False)
+    tree_hash = Column(String(64), ForeignKey("metric_tree_versions.tree_hash"), nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    min_scores = Column(LargeBinary, nullable=False)    # float32 vectors in node_ids order
+    mean_scores = Column(LargeBinary, nullable=False)
+    max_scores = Column(LargeBinary, nullable=False)
+    last_scores = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index("ix_metric_snapshot_rollups_tier_bucket", "tier", "bucket_start"),
+    )
+
+
+class EventLeafAggregate(Base):
+    __tablename__ = "event_leaf_aggregates"
+
+    leaf_id = Column(String(100), primary_key=True)  # event-driven leaf node_id
+    supplier_id = Column(String, primary_key=True)  # "" for events without a supplier
+    bucket_date = Column(Date, primary_key=True)    # event day (actual, else planned, else recorded)
+    value_sum = Column(Float, nullable=False, default=0.0)
+    value_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_event_leaf_aggregates_bucket", "bucket_date"),
+    )
+
+
+class AlertOutbox(Base):
+    __tablename__ = "alert_outbox"
+
+    message_id = Column(Integer, primary_key=True, autoincrement=True)
+    origin = Column(String(36), nullable=False)     # publishing worker; it delivers its own messages directly
+    message = Column(Text, nullable=False)          # serialized broadcast payload
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_alert_outbox_created", "created_at"),
+    )
+
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String(50), primary_key=True)     # background job the lease is for
+    holder = Column(String(36), nullable=False)     # worker currently running it
+    expires_at = Column(DateTime, nullable=False)   # others may take over after this
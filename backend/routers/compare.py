@@ -2,8 +2,8 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from database import get_db
 from models.db_models import SupplyChainEvent
-from routers.tree import get_current_leaf_scores
-from services.metric_tree import propagate_scores, trace_root_cause
+from services.metric_tree import trace_root_cause, STATUS_RED, STATUS_AMBER
+from services.tree_state import get_current_tree_state
 
 router = APIRouter()
 
@@ -43,20 +43,19 @@ def flat_vs_hierarchical(db: Session = Depends(get_db)):
     }
 
     # HIERARCHICAL VIEW: metric tree trace
-    leaf_scores = get_current_leaf_scores(db)
-    all_scores = propagate_scores(leaf_scores)
+    all_scores = get_current_tree_state(db).result
     trace = trace_root_cause(all_scores)
 
-    red_nodes = [n for n in all_scores.values() if n["status"] == "red"]
-    amber_nodes = [n for n in all_scores.values() if n["status"] == "amber"]
+    red_nodes = all_scores.nodes(all_scores.indices(STATUS_RED))
+    amber_count = len(all_scores.indices(STATUS_AMBER))
 
     tree_report = {
         "view_type": "hierarchical",
         "description": "Metric Tree view — shows WHAT happened, WHY, and PREDICTED impact",
-        "root_health_score": round(all_scores.get("root", {}).get("score", 0), 1),
-        "root_status": all_scores.get("root", {}).get("status", "unknown"),
+        "root_health_score": round(all_scores.score("root"), 1),
+        "root_status": all_scores.status("root"),
         "red_node_count": len(red_nodes),
-        "amber_node_count": len(amber_nodes),
+        "amber_node_count": amber_count,
         "root_cause_trace": [
             {"node_id": t["node_id"], "label": t["label"], "score": t["score"], "status": t["status"]}
             for t in trace
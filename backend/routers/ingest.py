@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.orm import Session
+from database import get_db
+from services.event_ingest import (
+    INGEST_BATCH_SIZE, MAX_BATCH_SIZE, ingest_events, iter_lines, parse_csv, parse_ndjson,
+)
+
+router = APIRouter()
+
+
+@router.post("/events")
+async def ingest_supply_chain_events(
+    request: Request,
+    format: str = None,
+    batch_size: int = Query(INGEST_BATCH_SIZE, ge=1, le=MAX_BATCH_SIZE),
+    db: Session = Depends(get_db),
+):
+    """
+    Stream SupplyChainEvent records as NDJSON (one JSON object per line) or
+    CSV with a header row. ?format=ndjson|csv, otherwise inferred from the
+    Content-Type. Returns accept/reject counts per batch, the first
+    validation errors and the leaves rescored from the new events.
+    """
+    format = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if format not in ("ndjson", "csv"):
+        return {"error": "format must be ndjson or csv"}
+    parse = parse_csv if format == "csv" else parse_ndjson
+    return await ingest_events(db, parse(iter_lines(request.stream())), batch_size)
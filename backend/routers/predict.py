@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from database import get_db
-from routers.tree import get_current_leaf_scores
-from services.metric_tree import propagate_scores
+from services.metric_tree import STATUS_RED
+from services.tree_state import get_current_tree_state
 from services import ml_service
 
 router = APIRouter()
@@ -11,8 +11,7 @@ router = APIRouter()
 @router.get("/delay")
 def predict_delay(db: Session = Depends(get_db)):
     """Predict supply delay days from current tree state."""
-    leaf_scores = get_current_leaf_scores(db)
-    all_scores = propagate_scores(leaf_scores)
+    all_scores = get_current_tree_state(db).result
     result = ml_service.predict_delay(all_scores)
     return result
 
@@ -20,8 +19,7 @@ def predict_delay(db: Session = Depends(get_db)):
 @router.get("/resolution/{disruption_type}/{severity}")
 def predict_resolution(disruption_type: str, severity: str, db: Session = Depends(get_db)):
     """Predict resolution days for a disruption type + severity."""
-    leaf_scores = get_current_leaf_scores(db)
-    all_scores = propagate_scores(leaf_scores)
+    all_scores = get_current_tree_state(db).result
     result = ml_service.predict_resolution(disruption_type, severity, all_scores)
     return result
 
@@ -36,19 +34,14 @@ def predict_impact(delay_days: int, resolution_days: int, chip_criticality: int
 @router.get("/full")
 def full_prediction(db: Session = Depends(get_db)):
     """Run all 3 models and return combined prediction."""
-    leaf_scores = get_current_leaf_scores(db)
-    all_scores = propagate_scores(leaf_scores)
+    all_scores = get_current_tree_state(db).result
 
     delay = ml_service.predict_delay(all_scores)
     delay_days = delay.get("predicted_delay_days", 7)
 
     # Determine disruption type from worst node
-    red_nodes = [n for n in all_scores.values() if n["status"] == "red"]
-    if red_nodes:
-        worst = min(red_nodes, key=lambda x: x["score"])
-        node_id = worst["node_id"]
-    else:
-        node_id = ""
+    worst = all_scores.worst_index(STATUS_RED)
+    node_id = all_scores.tree.node_ids[worst] if worst is not None else ""
 
     dtype = "logistics"
     if "fab_concentration" in node_id:
@@ -2,35 +2,45 @@ from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from database import get_db
 from services.alert_engine import build_alert_payload, log_disruption_to_db
-from services.metric_tree import propagate_scores, get_leaf_nodes
+from services.metric_tree import propagate_scores, get_leaf_nodes, get_tree, STATUS_RED
+from services.broadcast_backend import broadcast_backend
+from services.broadcaster import Subscription, broadcaster
 from models.db_models import MetricSnapshot
 import random
-import json
 from datetime import datetime
 
 router = APIRouter()
 
-# Store connected WebSocket clients
-connected_clients = []
-
 
 @router.websocket("/ws/alerts")
 async def websocket_alerts(websocket: WebSocket):
+    """
+    Alerts and tree deltas, filtered per client. Filters come from the query
+    string (?prefix=&min_severity=&disruption_types=a,b&deltas=1) and can be
+    changed later by sending {"type": "subscribe", ...}; see Subscription.
+    Reconnecting clients pass &last_seq=&epoch= to catch up on what they missed.
+    """
     await websocket.accept()
-    connected_clients.append(websocket)
     try:
+        subscription = Subscription.from_params(websocket.query_params)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "data": {"error": str(e)}})
+        await websocket.close(code=1008)
+        return
+    client = broadcaster.connect(websocket, subscription)
+    try:
+        await broadcaster.resume(client, websocket.query_params.get("last_seq"), websocket.query_params.get("epoch"))
         while True:
-            await websocket.receive_text()  # Keep alive
+            await broadcaster.handle_message(client, await websocket.receive_text())
     except WebSocketDisconnect:
-        connected_clients.remove(websocket)
+        pass
+    finally:
+        await broadcaster.disconnect(client)
 
 
 async def broadcast_alert(alert: dict):
-    for client in connected_clients:
-        try:
-            await client.send_text(json.dumps(alert))
-        except Exception:
-            pass
+    """Send an alert to the dashboards of every worker (see BROADCAST_BACKEND)."""
+    await broadcast_backend.publish({"type": "alert", "data": alert})
 
 
 @router.post("/disruption")
@@ -43,7 +53,8 @@ async def simulate_disruption(
     Inject a synthetic disruption into the metric tree.
     Triggers RED scores on relevant nodes and generates alert.
     """
-    leaf_nodes = get_leaf_nodes()
+    tree = get_tree()
+    leaf_nodes = get_leaf_nodes(tree)
     random.seed(datetime.now().microsecond)
 
     # Simulate degraded scores based on disruption type
@@ -75,7 +86,7 @@ async def simulate_disruption(
         if bad_node in leaf_scores:
             leaf_scores[bad_node] = random.uniform(lo, hi)
 
-    all_scores = propagate_scores(leaf_scores)
+    all_scores = propagate_scores(leaf_scores, tree)
     alert = build_alert_payload(all_scores)
 
     if alert:
@@ -89,5 +100,5 @@ async def simulate_disruption(
         "disruption_type": disruption_type,
         "severity": severity,
         "alert": alert,
-        "affected_node_count": len([n for n in all_scores.values() if n["status"] == "red"]),
+        "affected_node_count": len(all_scores.indices(STATUS_RED)),
     }
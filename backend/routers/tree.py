@@ -1,92 +1,183 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
 from database import get_db
-from services.metric_tree import propagate_scores, get_leaf_nodes, METRIC_TREE_DEFINITION, get_all_alerts
-from models.db_models import MetricSnapshot
-import random
+from services.metric_tree import compute_status, get_tree, leaf_influence
+from services.slicing import SLICE_DIMENSIONS, score_slices
+from services.snapshot_store import HISTORY_TARGET_POINTS, node_history, node_series, snapshot_as_of
+from services.tree_state import get_current_tree_state, tree_state_cache
 
 router = APIRouter()
 
 
-def get_current_leaf_scores(db: Session):
-    """Pull the most recent snapshot scores for leaf nodes, or simulate if empty."""
-    leaf_nodes = get_leaf_nodes()
-    # Try DB first
-    latest = {}
-    for node_id in leaf_nodes:
-        snap = (
-            db.query(MetricSnapshot)
-            .filter(MetricSnapshot.node_id == node_id)
-            .order_by(MetricSnapshot.evaluated_at.desc())
-            .first()
-        )
-        if snap:
-            latest[node_id] = snap.score
-
-    # If no snapshots yet, simulate
-    if not latest:
-        random.seed(99)
-        for node_id in leaf_nodes:
-            base = random.uniform(45, 95)
-            # Inject realistic low scores for demo
-            if "fab_concentration" in node_id or "taiwan" in node_id:
-                base = random.uniform(20, 45)
-            elif "material" in node_id:
-                base = random.uniform(30, 55)
-            latest[node_id] = base
-    return latest
+def _etag(version: str, weak: bool = False) -> str:
+    return f'W/"{version}"' if weak else f'"{version}"'
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/"x" and "x" match each other
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [_opaque(t.strip()) for t in header.split(",")]
+    return "*" in tags or _opaque(etag) in tags
+
+
+def _conditional(request: Request, etag: str, body=None) -> Response:
+    """304 when the client already holds ``etag``, else ``body()`` with the ETag attached."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body(), media_type="application/json", headers=headers)
+
+
+def _cached_state_response(request: Request, db: Session, body, weak: bool = False) -> Response:
+    """
+    ``weak`` marks bodies that carry more than the evaluated content (e.g.
+    timestamps), so equal tags only promise equivalent, not identical, bytes.
+    """
+    # A fresh cached state answers If-None-Match without touching the DB
+    state = tree_state_cache.peek()
+    if state is not None and _not_modified(request, _etag(state.version, weak)):
+        return _conditional(request, _etag(state.version, weak))
+    state = get_current_tree_state(db)
+    return _conditional(request, _etag(state.version, weak), lambda: body(state))
+
+
+def _naive_utc(t: datetime) -> datetime:
+    return t.astimezone(timezone.utc).replace(tzinfo=None) if t and t.tzinfo else t
 
 
 @router.get("/snapshot")
-def get_full_snapshot(db: Session = Depends(get_db)):
-    """Full metric tree with all node scores."""
-    leaf_scores = get_current_leaf_scores(db)
-    all_scores = propagate_scores(leaf_scores)
-    # Convert to list for JSON serialization
-    nodes = list(all_scores.values())
-    return {
-        "total_nodes": len(nodes),
-        "root_score": all_scores.get("root", {}).get("score", 0),
-        "root_status": all_scores.get("root", {}).get("status", "unknown"),
-        "nodes": nodes,
-    }
+def get_full_snapshot(
+    request: Request,
+    root: str = None,
+    depth: int = None,
+    as_of: datetime = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Full metric tree with all node scores, or with ?root=<node_id>&depth=<n>
+    only that subtree down to n levels below it. ?as_of=<timestamp> returns
+    the tree as it was scored at that moment instead of the latest state.
+    """
+    if depth is not None and depth < 0:
+        return {"error": "depth must be >= 0"}
+    if as_of is not None:
+        return _snapshot_as_of(request, db, _naive_utc(as_of), root, depth)
+    if root is not None and root not in get_tree().index:
+        return {"error": "Node not found"}
+    # Serialized straight from the score/status arrays, once per evaluation
+    return _cached_state_response(request, db, lambda state: state.snapshot_body(root, depth))
+
+
+def _snapshot_as_of(request: Request, db: Session, as_of: datetime, root: str, depth: int):
+    found = snapshot_as_of(db, as_of, get_tree())
+    if found is None:
+        return {"error": "No snapshot recorded at or before as_of"}
+    resolution, evaluated_at, result = found
+    tree = result.tree
+    if root is not None and root not in tree.index:
+        return {"error": "Node not found"}
+
+    # A stored evaluation never changes, so its identity is a stable validator
+    etag = _etag(f"{tree.version}@{evaluated_at.isoformat()}")
+
+    def body() -> bytes:
+        if root is None and depth is None:
+            snapshot = result.snapshot_json()
+        else:
+            start = root or tree.node_ids[tree.root]
+            snapshot = result.snapshot_json(tree.subtree(start, depth), tree.index[start])
+        head = f'{{"as_of":"{as_of.isoformat()}","evaluated_at":"{evaluated_at.isoformat()}",' \
+               f'"resolution":"{resolution}","tree_version":"{tree.version}",'
+        return head.encode() + snapshot[1:]
+
+    return _conditional(request, etag, body)
 
 
 @router.get("/node/{node_id:path}")
-def get_node(node_id: str, db: Session = Depends(get_db)):
-    """Single node with history."""
-    leaf_scores = get_current_leaf_scores(db)
-    all_scores = propagate_scores(leaf_scores)
+def get_node(
+    node_id: str,
+    start: datetime = Query(None, alias="from"),
+    end: datetime = Query(None, alias="to"),
+    max_points: int = Query(HISTORY_TARGET_POINTS, ge=2, le=5000),
+    db: Session = Depends(get_db),
+):
+    """
+    Single node with history: the last 30 evaluations, or with
+    ?from=&to=&max_points= a range served from the coarsest retained tier
+    that resolves it, min/max downsampled to at most max_points.
+    """
+    all_scores = get_current_tree_state(db).result
     node = all_scores.get(node_id)
     if not node:
         return {"error": "Node not found"}
 
-    history = (
-        db.query(MetricSnapshot)
-        .filter(MetricSnapshot.node_id == node_id)
-        .order_by(MetricSnapshot.evaluated_at.desc())
-        .limit(30)
-        .all()
-    )
-    node["history"] = [{"score": h.score, "status": h.status, "evaluated_at": h.evaluated_at.isoformat()} for h in history]
+    if start is None and end is None:
+        node["history"] = node_history(db, node_id, limit=30)
+        return node
+
+    # snapshot timestamps are stored as naive UTC
+    start, end = (_naive_utc(t) for t in (start, end or datetime.utcnow()))
+    if start is None or start >= end:
+        return {"error": "from must be before to"}
+    tier, points = node_series(db, node_id, start, end, max_points)
+    node["history_tier"] = tier
+    node["history"] = [
+        {
+            "score": round(p["score"], 2),
+            "min": round(p["min"], 2),
+            "max": round(p["max"], 2),
+            "status": compute_status(p["score"]),
+            "evaluated_at": p["t"].isoformat(),
+        }
+        for p in points
+    ]
     return node
 
 
 @router.get("/alerts")
-def get_alerts(db: Session = Depends(get_db)):
+def get_alerts(request: Request, db: Session = Depends(get_db)):
     """All active RED/AMBER nodes."""
-    leaf_scores = get_current_leaf_scores(db)
-    all_scores = propagate_scores(leaf_scores)
-    alerts = get_all_alerts(all_scores)
-    return {"total_alerts": len(alerts), "alerts": alerts}
+    # flagged_at is stamped per recomputation, so the content version is only a weak validator
+    return _cached_state_response(request, db, lambda state: state.alerts_body(), weak=True)
 
 
-@router.get("/tree-definition")
-def get_tree_definition():
-    """Return the raw metric tree definition (node structure)."""
+@router.get("/influence")
+def get_influence(node: str = "root", limit: int = None, db: Session = Depends(get_db)):
+    """Each leaf's contribution to a node's score and the gain per point of leaf improvement."""
+    state = get_current_tree_state(db)
+    if node not in state.tree.index:
+        return {"error": "Node not found"}
+    leaves = leaf_influence(state.leaf_scores, node, state.tree)
     return {
-        "nodes": [
-            {"node_id": k, **v}
-            for k, v in METRIC_TREE_DEFINITION.items()
-        ]
+        "node_id": node,
+        "score": state.result.score(node),
+        "total_leaves": len(leaves),
+        "leaves": leaves[:limit] if limit else leaves,
     }
+
+
+@router.get("/slices")
+def get_worst_slices(dimension: str = None, node: str = "root", limit: int = 20, db: Session = Depends(get_db)):
+    """Per-OEM / per-supplier / per-SKU trees scored in one batch, worst slices first."""
+    state = get_current_tree_state(db)
+    if node not in state.tree.index:
+        return {"error": "Node not found"}
+    if dimension and dimension not in SLICE_DIMENSIONS:
+        return {"error": f"Unknown dimension; expected one of {', '.join(SLICE_DIMENSIONS)}"}
+    dimensions = [dimension] if dimension else list(SLICE_DIMENSIONS)
+    slices = score_slices(db, state.leaf_scores, dimensions, node, state.tree)
+    return {"node_id": node, "total_slices": len(slices), "slices": slices[:limit]}
+
+
+@router.get("/tree-definition")
+def get_tree_definition(request: Request):
+    """Return the raw metric tree definition (node structure)."""
+    tree = get_tree()
+    return _conditional(request, _etag(tree.version), lambda: tree.definition_json)
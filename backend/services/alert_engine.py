@@ -2,11 +2,21 @@
 Alert Engine
 ------------
 Detects RED/AMBER nodes, logs disruptions, generates structured alert JSON.
+
+AlertTracker keeps a per-leaf alert state in memory and turns successive
+evaluations into open / escalate / resolve transitions, with hysteresis
+around the RED/AMBER thresholds and cooldowns against flapping, so the
+disruption log and dashboards only see state changes.
 """
-from datetime import datetime
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from models.db_models import DisruptionLog, MetricSnapshot
-from services.metric_tree import trace_root_cause, METRIC_TREE_DEFINITION
+from models.db_models import DisruptionLog
+from services.metric_tree import AMBER_THRESHOLD, RED_THRESHOLD, STATUS_RED, TreeResult, trace_root_cause
+from services.snapshot_store import write_snapshots
+from services.tree_state import invalidate_tree_state
 import uuid
 
 
@@ -39,15 +49,27 @@ def severity_from_score(score: float) -> str:
     return "low"
 
 
-def build_alert_payload(all_scores: dict, disruption_id: str = None) -> dict:
-    """Build a structured alert JSON for the worst RED node."""
-    red_nodes = {k: v for k, v in all_scores.items() if v["status"] == "red"}
-    if not red_nodes:
+def _ancestor_path(all_scores: TreeResult, index: int) -> List[Dict]:
+    parent = all_scores.tree.parent
+    path = []
+    while index >= 0:
+        path.append(all_scores.node(index))
+        index = int(parent[index])
+    return path[::-1]
+
+
+def build_alert_payload(all_scores: TreeResult, disruption_id: str = None, node_index: int = None) -> dict:
+    """Build a structured alert JSON for the worst RED node (or for ``node_index``)."""
+    worst_index = all_scores.worst_index(STATUS_RED) if node_index is None else node_index
+    if worst_index is None:
         return {}
 
     # Find the most critical leaf RED node
-    worst = min(red_nodes.values(), key=lambda x: x["score"])
-    trace = trace_root_cause(all_scores, start="root")
+    worst = all_scores.node(worst_index)
+    if node_index is None:
+        trace = trace_root_cause(all_scores, start="root")
+    else:
+        trace = _ancestor_path(all_scores, node_index)
 
     disruption_type = detect_disruption_type(worst["node_id"])
     severity = severity_from_score(worst["score"])
@@ -65,7 +87,7 @@ def build_alert_payload(all_scores: dict, disruption_id: str = None) -> dict:
     return {
         "alert_id": disruption_id or str(uuid.uuid4()),
         "triggered_at": datetime.utcnow().isoformat(),
-        "root_score": round(all_scores.get("root", {}).get("score", 0), 2),
+        "root_score": all_scores.score("root"),
         "root_cause_path": [t["node_id"] for t in trace],
         "root_cause_label_path": [t["label"] for t in trace],
         "leaf_node": worst["node_id"],
@@ -106,19 +128,168 @@ def log_disruption_to_db(db: Session, alert_payload: dict, predicted_delay: int
     return disruption
 
 
-def persist_metric_snapshot(db: Session, all_scores: dict):
-    """Write a snapshot of all node scores to the DB."""
-    now = datetime.utcnow()
-    for node_id, data in all_scores.items():
-        snap = MetricSnapshot(
-            node_id=node_id,
-            node_level=node_id.count("."),
-            node_label=data["label"],
-            score=data["score"],
-            status=data["status"],
-            flagged=data["flagged"],
-            parent_node_id=data.get("parent"),
-            evaluated_at=now,
-        )
-        db.add(snap)
+def persist_metric_snapshot(db: Session, all_scores: TreeResult):
+    """Write a snapshot of all node scores to the DB (layout per SNAPSHOT_STORAGE)."""
+    write_snapshots(db, [(datetime.utcnow(), all_scores)])
     db.commit()
+    invalidate_tree_state()
+
+
+# ── Alert state machine ────────────────────────────────────────────────────────
+ALERT_HYSTERESIS_POINTS = float(os.getenv("ALERT_HYSTERESIS_POINTS", "5"))
+ALERT_ESCALATION_COOLDOWN_SECONDS = float(os.getenv("ALERT_ESCALATION_COOLDOWN_SECONDS", "900"))
+ALERT_REOPEN_COOLDOWN_SECONDS = float(os.getenv("ALERT_REOPEN_COOLDOWN_SECONDS", "1800"))
+
+LEVEL_GREEN, LEVEL_AMBER, LEVEL_RED = 0, 1, 2
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+
+def alert_level(score: float, previous: int, band: float = ALERT_HYSTERESIS_POINTS) -> int:
+    """
+    Status level with hysteresis: entering AMBER/RED uses the normal
+    thresholds, but leaving a level requires recovering ``band`` points past
+    its threshold, so a score hovering at a boundary does not flap.
+    """
+    level = LEVEL_RED if score < RED_THRESHOLD else LEVEL_AMBER if score < AMBER_THRESHOLD else LEVEL_GREEN
+    if previous == LEVEL_RED and score < RED_THRESHOLD + band:
+        return LEVEL_RED
+    if previous >= LEVEL_AMBER and level == LEVEL_GREEN and score < AMBER_THRESHOLD + band:
+        return LEVEL_AMBER
+    return level
+
+
+class _LeafAlert:
+    __slots__ = ("level", "disruption_id", "severity", "opened_at", "notified_at", "resolved_at")
+
+    def __init__(self):
+        self.level = LEVEL_GREEN
+        self.disruption_id: Optional[str] = None
+        self.severity: Optional[str] = None
+        self.opened_at: Optional[datetime] = None
+        self.notified_at: Optional[datetime] = None
+        self.resolved_at: Optional[datetime] = None
+
+
+class AlertTracker:
+    """
+    In-memory alert state per leaf. observe() compares an evaluation with
+    the previous one and returns only the transitions:
+
+        open      leaf entered RED; a new disruption is logged. Re-entering
+                  RED within ALERT_REOPEN_COOLDOWN_SECONDS of resolving
+                  reopens the previous disruption instead.
+        escalate  severity worsened while open, at most once per
+                  ALERT_ESCALATION_COOLDOWN_SECONDS
+        resolve   leaf recovered past RED_THRESHOLD + ALERT_HYSTERESIS_POINTS
+
+    Open disruptions are reloaded from the DB on first use, so a restart
+    does not log every red leaf again.
+    """
+
+    def __init__(self):
+        self._leaves: Dict[str, _LeafAlert] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load_open(self, db: Session) -> None:
+        """Resume the disruptions still open in the log."""
+        with self._lock:
+            if self._loaded:
+                return
+            for d in db.query(DisruptionLog).filter(DisruptionLog.resolved_at.is_(None)).all():
+                state = self._leaves.setdefault(d.triggered_node_id, _LeafAlert())
+                state.level, state.disruption_id, state.severity = LEVEL_RED, d.disruption_id, d.severity
+                state.opened_at = state.notified_at = d.triggered_at
+            self._loaded = True
+
+    def reset(self) -> None:
+        """Forget all state; the next load_open() resumes from the DB again."""
+        with self._lock:
+            self._leaves.clear()
+            self._loaded = False
+
+    def active(self) -> Dict[str, str]:
+        """leaf node_id → disruption_id of every open alert."""
+        with self._lock:
+            return {n: a.disruption_id for n, a in self._leaves.items() if a.level == LEVEL_RED}
+
+    def observe(self, all_scores: TreeResult, now: datetime = None) -> List[Tuple[str, dict]]:
+        """Advance every leaf's state; returns [(transition, alert payload)]."""
+        now = now or datetime.utcnow()
+        tree = all_scores.tree
+        scores = all_scores.rounded
+        transitions = []
+        with self._lock:
+            for i in tree.leaf_idx.tolist():
+                node_id = tree.node_ids[i]
+                state = self._leaves.get(node_id)
+                previous = state.level if state else LEVEL_GREEN
+                level = alert_level(scores[i], previous)
+                if state is None:
+                    if level == LEVEL_GREEN:
+                        continue
+                    state = self._leaves[node_id] = _LeafAlert()
+                state.level = level
+
+                if level == LEVEL_RED:
+                    severity = severity_from_score(scores[i])
+                    if previous != LEVEL_RED:
+                        reopen = (
+                            state.resolved_at is not None
+                            and now - state.resolved_at < timedelta(seconds=ALERT_REOPEN_COOLDOWN_SECONDS)
+                        )
+                        if not reopen:
+                            state.disruption_id, state.opened_at = str(uuid.uuid4()), now
+                        state.severity, state.notified_at, state.resolved_at = severity, now, None
+                        transitions.append(("reopen" if reopen else "open", self._payload(all_scores, i, state)))
+                    elif (
+                        SEVERITY_RANK[severity] > SEVERITY_RANK[state.severity]
+                        and now - state.notified_at >= timedelta(seconds=ALERT_ESCALATION_COOLDOWN_SECONDS)
+                    ):
+                        state.severity, state.notified_at = severity, now
+                        transitions.append(("escalate", self._payload(all_scores, i, state)))
+                elif previous == LEVEL_RED:
+                    state.resolved_at = now
+                    transitions.append(("resolve", self._payload(all_scores, i, state)))
+        return transitions
+
+    @staticmethod
+    def _payload(all_scores: TreeResult, index: int, state: _LeafAlert) -> dict:
+        payload = build_alert_payload(all_scores, state.disruption_id, node_index=index)
+        payload["severity"] = state.severity
+        payload["opened_at"] = state.opened_at.isoformat()
+        if state.resolved_at is not None:
+            payload["resolved_at"] = state.resolved_at.isoformat()
+        return payload
+
+
+def record_alert_transitions(db: Session, transitions: List[Tuple[str, dict]]) -> None:
+    """Apply transitions to the disruption log in one commit."""
+    if not transitions:
+        return
+    ids = [payload["alert_id"] for kind, payload in transitions if kind != "open"]
+    existing = {d.disruption_id: d for d in db.query(DisruptionLog).filter(DisruptionLog.disruption_id.in_(ids))}
+    for kind, payload in transitions:
+        if kind == "open":
+            db.add(DisruptionLog(
+                disruption_id=payload["alert_id"],
+                triggered_node_id=payload["leaf_node"],
+                disruption_type=payload["disruption_type"],
+                severity=payload["severity"],
+                triggered_at=datetime.fromisoformat(payload["opened_at"]),
+            ))
+            continue
+        disruption = existing.get(payload["alert_id"])
+        if disruption is None:
+            continue
+        if kind == "escalate":
+            disruption.severity = payload["severity"]
+        elif kind == "reopen":
+            disruption.severity, disruption.resolved_at, disruption.actual_resolution_days = payload["severity"], None, None
+        elif kind == "resolve":
+            disruption.resolved_at = datetime.fromisoformat(payload["resolved_at"])
+            disruption.actual_resolution_days = (disruption.resolved_at - disruption.triggered_at).days
+    db.commit()
+
+
+alert_tracker = AlertTracker()
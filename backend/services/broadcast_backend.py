@@ -0,0 +1,135 @@
+"""
+Broadcast Backends
+------------------
+Carries broadcast messages to the WebSocket clients of every API worker.
+
+BROADCAST_BACKEND selects the transport:
+    memory  in-process only; enough for a single worker (default)
+    db      alert_outbox table: each message is delivered to the local
+            clients right away and inserted into the outbox, and every
+            worker polls the outbox every BROADCAST_POLL_SECONDS for
+            messages published by other workers. Works on SQLite and
+            Postgres, so `uvicorn --workers N` reaches all dashboards.
+
+Outbox ids are not assigned in commit order, so polling "ids above the
+last one seen" could skip a row that commits late. Each poll instead
+re-reads the rows created in the last BROADCAST_OUTBOX_LOOKBACK_SECONDS
+before the previous poll and delivers the ones it has not seen yet.
+
+Both hand decoded {"type", "data"} messages to the local Broadcaster,
+which applies each client's subscription filters.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from database import SessionLocal
+from models.db_models import AlertOutbox
+from services.broadcaster import broadcaster, encode
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "memory")
+BROADCAST_POLL_SECONDS = float(os.getenv("BROADCAST_POLL_SECONDS", "0.5"))
+BROADCAST_OUTBOX_RETENTION_SECONDS = float(os.getenv("BROADCAST_OUTBOX_RETENTION_SECONDS", "300"))
+BROADCAST_OUTBOX_LOOKBACK_SECONDS = float(os.getenv("BROADCAST_OUTBOX_LOOKBACK_SECONDS", "10"))
+
+
+class InProcessBackend:
+    def __init__(self, deliver: Callable[[Dict[str, Any]], Any] = broadcaster.publish):
+        self.deliver = deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        self.deliver(message)
+
+
+class OutboxBackend(InProcessBackend):
+    """Cross-process delivery through the alert_outbox table, polled by every worker."""
+
+    def __init__(self, deliver: Callable[[Dict[str, Any]], Any] = broadcaster.publish, poll: float = BROADCAST_POLL_SECONDS):
+        super().__init__(deliver)
+        self.origin = str(uuid.uuid4())
+        self.poll = poll
+        self._floor = datetime.utcnow()
+        self._last_poll = self._floor
+        self._seen: Dict[int, datetime] = {}   # message_id → created_at, for rows still inside the lookback
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        # Only messages published from now on; older ones were for earlier connections
+        self._floor = self._last_poll = datetime.utcnow()
+        self._task = asyncio.create_task(self._run(), name="broadcast-outbox")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        self.deliver(message)
+        await asyncio.to_thread(self._insert, encode(message))
+
+    async def _run(self) -> None:
+        cycles = 0
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                for message in await asyncio.to_thread(self._fetch):
+                    self.deliver(message)
+                cycles += 1
+                if cycles * self.poll >= BROADCAST_OUTBOX_RETENTION_SECONDS:
+                    cycles = 0
+                    await asyncio.to_thread(self._prune)
+            except Exception:
+                logger.exception("alert outbox poll failed")
+
+    def _insert(self, message: str) -> None:
+        with SessionLocal() as db:
+            db.add(AlertOutbox(origin=self.origin, message=message))
+            db.commit()
+
+    def _fetch(self) -> List[Dict[str, Any]]:
+        polled_at = datetime.utcnow()
+        cutoff = max(self._floor, self._last_poll - timedelta(seconds=BROADCAST_OUTBOX_LOOKBACK_SECONDS))
+        with SessionLocal() as db:
+            rows = (
+                db.query(AlertOutbox.message_id, AlertOutbox.origin, AlertOutbox.message, AlertOutbox.created_at)
+                .filter(AlertOutbox.created_at >= cutoff)
+                .order_by(AlertOutbox.created_at, AlertOutbox.message_id)
+                .all()
+            )
+        self._last_poll = polled_at
+        fresh = [r for r in rows if r.message_id not in self._seen]
+        self._seen.update((r.message_id, r.created_at) for r in fresh)
+        self._seen = {i: created_at for i, created_at in self._seen.items() if created_at >= cutoff}
+        return [json.loads(r.message) for r in fresh if r.origin != self.origin]
+
+    def _prune(self) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=BROADCAST_OUTBOX_RETENTION_SECONDS)
+        with SessionLocal() as db:
+            db.query(AlertOutbox).filter(AlertOutbox.created_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+
+
+BACKENDS = {"memory": InProcessBackend, "db": OutboxBackend}
+
+
+def create_backend(name: str = BROADCAST_BACKEND) -> InProcessBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown BROADCAST_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+broadcast_backend = create_backend()
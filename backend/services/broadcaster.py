@@ -0,0 +1,379 @@
+"""
+Alert Broadcaster
+-----------------
+Fans messages out to connected WebSocket dashboards without letting one
+client slow down the others or the publisher.
+
+publish() never awaits a socket: it puts the encoded message on every
+client's bounded queue, and a writer task per client drains its own queue.
+A client whose queue is full is downgraded, meaning its oldest queued
+message is dropped so it stays on recent data.
+Once it has dropped WS_MAX_DROPPED_MESSAGES messages in a row, or a send
+takes longer than WS_SEND_TIMEOUT_SECONDS, it is disconnected. Clients
+that fail or disconnect are removed.
+
+Messages are {"type": ..., "data": ...} envelopes. Each client carries a
+Subscription that decides which alerts it receives (subtree prefix,
+minimum severity, disruption types) and whether it wants tree deltas,
+trimmed to its subtree. Clients with the same view of a message share
+one encoded copy.
+
+Every published message gets the next seq and is kept in a ring buffer of
+the last WS_REPLAY_BUFFER_SIZE messages. A client reconnecting with
+?last_seq=&epoch= (or a subscribe message carrying them) gets just the
+messages it missed, or one compacted snapshot when they are gone.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from database import SessionLocal
+from services.alert_engine import SEVERITY_RANK
+from services.metric_tree import STATUS_LABELS
+from services.tree_state import CachedTreeState, get_current_tree_state, tree_state_cache
+
+logger = logging.getLogger(__name__)
+
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "64"))
+WS_MAX_DROPPED_MESSAGES = int(os.getenv("WS_MAX_DROPPED_MESSAGES", "256"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1024"))
+
+
+def _flag(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.lower() not in ("0", "false", "no", "")
+    return bool(value)
+
+
+def encode(message: Any) -> str:
+    return message if isinstance(message, str) else json.dumps(message, separators=(",", ":"))
+
+
+def _current_tree_state() -> CachedTreeState:
+    with SessionLocal() as db:
+        return get_current_tree_state(db)
+
+
+# ── Subscriptions ──────────────────────────────────────────────────────────────
+class Subscription:
+    """
+    What one client wants to receive. Built from WebSocket query parameters
+    or a {"type": "subscribe", ...} message with the same keys:
+
+        prefix            only nodes in this subtree (the node and its descendants)
+        min_severity      only alerts at or above low|medium|high|critical
+        disruption_types  only alerts of these types (list, or comma-separated)
+        alerts            receive alerts (default on)
+        deltas            receive tree deltas (default off)
+    """
+
+    def __init__(
+        self,
+        prefix: Optional[str] = None,
+        min_severity: Optional[str] = None,
+        disruption_types: Optional[Iterable[str]] = None,
+        alerts: bool = True,
+        deltas: bool = False,
+    ):
+        if min_severity is not None and min_severity not in SEVERITY_RANK:
+            raise ValueError(f"min_severity must be one of {', '.join(SEVERITY_RANK)}")
+        self.prefix = prefix or None
+        self.min_severity = min_severity
+        self.disruption_types = frozenset(disruption_types) if disruption_types else None
+        self.alerts = alerts
+        self.deltas = deltas
+
+    @classmethod
+    def from_params(cls, params: Mapping[str, Any]) -> "Subscription":
+        """Parse query parameters or a subscribe message; raises ValueError on bad values."""
+        types = params.get("disruption_types")
+        if isinstance(types, str):
+            types = [t.strip() for t in types.split(",") if t.strip()]
+        elif types is not None and not isinstance(types, list):
+            raise ValueError("disruption_types must be a list or a comma-separated string")
+        return cls(
+            prefix=params.get("prefix"),
+            min_severity=params.get("min_severity") or None,
+            disruption_types=types,
+            alerts=_flag(params.get("alerts", True)),
+            deltas=_flag(params.get("deltas", False)),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prefix": self.prefix,
+            "min_severity": self.min_severity,
+            "disruption_types": sorted(self.disruption_types) if self.disruption_types else None,
+            "alerts": self.alerts,
+            "deltas": self.deltas,
+        }
+
+    def covers(self, node_id: Optional[str]) -> bool:
+        if self.prefix is None:
+            return True
+        return node_id is not None and (node_id == self.prefix or node_id.startswith(self.prefix + "."))
+
+    def view(self, kind: str, data: Any) -> Optional[tuple]:
+        """
+        Key of this client's version of a message, or None if it does not
+        want it. Clients with equal keys receive identical bytes.
+        """
+        if kind == "alert":
+            if not self.alerts or not self.covers(data.get("leaf_node")):
+                return None
+            if self.min_severity and SEVERITY_RANK.get(data.get("severity"), -1) < SEVERITY_RANK[self.min_severity]:
+                return None
+            if self.disruption_types is not None and data.get("disruption_type") not in self.disruption_types:
+                return None
+            return (kind,)
+        if kind == "delta":
+            return (kind, self.prefix) if self.deltas else None
+        return (kind,)
+
+    def render(self, kind: str, data: Any) -> Any:
+        """This client's version of a message it wants; None if nothing is left of it."""
+        if kind == "delta" and self.prefix is not None and "nodes" in data:
+            nodes = [n for n in data["nodes"] if self.covers(n["node_id"])]
+            if not nodes:
+                return None
+            data = {**data, "nodes": nodes}
+        return data
+
+
+class WebSocketClient:
+    def __init__(self, websocket: WebSocket, subscription: Subscription = None, queue_size: int = WS_QUEUE_SIZE):
+        self.websocket = websocket
+        self.subscription = subscription or Subscription()
+        self.seq = 0                # seq of the last message queued for this client
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0            # consecutive messages dropped on overflow
+        self.resuming = False       # skipped by publish() while a resume snapshot is built
+        self.writer: Optional[asyncio.Task] = None
+
+    def offer(self, message: str) -> bool:
+        """Queue a message, dropping the oldest one when full. False once the client is too far behind."""
+        try:
+            self.queue.put_nowait(message)
+            self.dropped = 0
+            return True
+        except asyncio.QueueFull:
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            self.dropped += 1
+            return self.dropped < WS_MAX_DROPPED_MESSAGES
+
+
+class Broadcaster:
+    def __init__(self, replay_size: int = WS_REPLAY_BUFFER_SIZE):
+        self._clients: Set[WebSocketClient] = set()
+        self.epoch = uuid.uuid4().hex[:12]     # seqs are only comparable within one epoch
+        self.seq = 0
+        self._replay: Deque[Tuple[int, str, Any]] = deque(maxlen=replay_size)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def connect(self, websocket: WebSocket, subscription: Subscription = None) -> WebSocketClient:
+        """Register an accepted socket and start its writer task."""
+        client = WebSocketClient(websocket, subscription)
+        client.seq = self.seq
+        client.writer = asyncio.create_task(self._write(client))
+        self._clients.add(client)
+        return client
+
+    async def disconnect(self, client: WebSocketClient) -> None:
+        self._clients.discard(client)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    async def _write(self, client: WebSocketClient) -> None:
+        try:
+            while True:
+                message = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(message), WS_SEND_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("dropping WebSocket client: %s", e or type(e).__name__)
+            await self._close(client)
+
+    async def _close(self, client: WebSocketClient, code: int = 1011) -> None:
+        self._clients.discard(client)
+        try:
+            await client.websocket.close(code=code)
+        except Exception:
+            pass
+
+    # ── Client requests ────────────────────────────────────────────────────────
+    def send(self, client: WebSocketClient, message: Any) -> None:
+        """Queue an unsequenced message for one client only (acks, errors)."""
+        self._offer(client, encode(message))
+
+    async def handle_message(self, client: WebSocketClient, text: str) -> None:
+        """
+        Handle a text frame from a client: {"type": "subscribe", ...} replaces
+        its filters (and with "last_seq" resumes from there); anything else
+        is a keepalive.
+        """
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or message.get("type") != "subscribe":
+            return
+        try:
+            client.subscription = Subscription.from_params(message)
+        except ValueError as e:
+            self.send(client, {"type": "error", "data": {"error": str(e)}})
+            return
+        await self.resume(client, message.get("last_seq"), message.get("epoch"))
+
+    async def resume(self, client: WebSocketClient, last_seq: Any = None, epoch: Optional[str] = None) -> None:
+        """
+        Acknowledge a client's filters and bring it up to date. Without
+        ``last_seq`` it starts from the current seq. Otherwise the messages it
+        missed since ``last_seq`` are replayed from the ring buffer, with
+        its tree deltas merged into one; if they are no longer all buffered,
+        are too many to queue, include a tree reset, or ``epoch`` is not
+        ours (restart, other worker), it gets one "snapshot" message instead.
+        """
+        try:
+            last_seq = None if last_seq in (None, "") else int(last_seq)
+        except (TypeError, ValueError):
+            self.send(client, {"type": "error", "data": {"error": "last_seq must be an integer"}})
+            return
+        if last_seq is None:
+            self._acknowledge(client, self.seq)
+            return
+
+        gap = self._gap(client.subscription, last_seq) if epoch == self.epoch else None
+        if gap is not None and len(gap) < client.queue.maxsize:
+            self._acknowledge(client, last_seq, "replay")
+            for seq, kind, data in gap:
+                self._offer_seq(client, seq, kind, data)
+            return
+
+        # Messages published while the snapshot is computed are not queued
+        # for the client but replayed after it; deltas carry absolute
+        # scores, so any the snapshot already reflects are harmless
+        seq = self.seq
+        client.resuming = True
+        try:
+            snapshot = await self._snapshot(client.subscription)
+        finally:
+            client.resuming = False
+        self._acknowledge(client, seq, "snapshot")
+        self.send(client, {"type": "snapshot", "seq": seq, "since": None, "data": snapshot})
+        for entry in self._gap(client.subscription, seq) or []:
+            self._offer_seq(client, *entry)
+
+    def _acknowledge(self, client: WebSocketClient, seq: int, resumed: Optional[str] = None) -> None:
+        client.seq = seq
+        self.send(client, {"type": "subscribed", "data": {
+            **client.subscription.to_dict(), "epoch": self.epoch, "seq": seq, "resumed": resumed,
+        }})
+
+    def _gap(self, subscription: Subscription, last_seq: int) -> Optional[List[Tuple[int, str, Any]]]:
+        """
+        The buffered messages after ``last_seq`` that ``subscription``
+        accepts, with tree deltas merged into the latest one; None if the
+        gap cannot be replayed.
+        """
+        if last_seq > self.seq or (last_seq < self.seq and (not self._replay or self._replay[0][0] > last_seq + 1)):
+            return None
+        start = len(self._replay) - (self.seq - last_seq)
+        entries: List[Tuple[int, str, Any]] = []
+        merged: Dict[str, Dict[str, Any]] = {}
+        for seq, kind, data in islice(self._replay, start, None):
+            if subscription.view(kind, data) is None:
+                continue
+            if kind == "delta":
+                if data.get("reset"):
+                    return None
+                # Later values win; the merged delta takes the latest delta's place
+                merged.update((n["node_id"], n) for n in data["nodes"])
+                entries = [e for e in entries if e[1] != "delta"]
+                data = {**data, "nodes": list(merged.values())}
+            entries.append((seq, kind, data))
+        return entries
+
+    async def _snapshot(self, subscription: Subscription) -> Dict[str, Any]:
+        """Current tree (the subscribed subtree) and its RED nodes, compacted into one message."""
+        state = tree_state_cache.peek() or await asyncio.to_thread(_current_tree_state)
+        tree, result = state.tree, state.result
+        indices = [i for i, node_id in enumerate(tree.node_ids) if subscription.covers(node_id)]
+        root = tree.index.get(subscription.prefix, tree.root)
+        return {
+            "tree_version": tree.version,
+            "root": tree.node_ids[root],
+            "root_score": result.rounded[root],
+            "root_status": STATUS_LABELS[result.codes[root]],
+            "nodes": result.delta(indices),
+            "alerts": [a for a in state.alerts() if subscription.covers(a["node_id"])],
+        }
+
+    # ── Publishing ─────────────────────────────────────────────────────────────
+    def publish(self, message: Dict[str, Any]) -> int:
+        """
+        Sequence a {"type", "data"} message, keep it in the replay buffer and
+        queue it for every client whose subscription accepts it, encoding each
+        distinct view once; must be called on the event loop. Returns the
+        number of clients reached.
+
+        Clients receive {"type", "seq", "since", "data"}, where "since" is the
+        seq of the previous message queued for that client. Messages a client
+        filters out are not sent, so seqs have holes; a "since" that is not
+        the client's last seen seq means it lost messages (e.g. dropped on
+        overflow) and should resume from its last seq.
+        """
+        self.seq += 1
+        kind, data = message["type"], message.get("data")
+        self._replay.append((self.seq, kind, data))
+        encoded: Dict[tuple, Optional[str]] = {}
+        reached = 0
+        for client in list(self._clients):
+            if client.resuming:
+                continue
+            key = client.subscription.view(kind, data)
+            if key is None:
+                continue
+            key += (client.seq,)
+            if key not in encoded:
+                encoded[key] = self._encode_seq(client, self.seq, kind, data)
+            if encoded[key] is not None:
+                client.seq = self.seq
+                if self._offer(client, encoded[key]):
+                    reached += 1
+        return reached
+
+    def _encode_seq(self, client: WebSocketClient, seq: int, kind: str, data: Any) -> Optional[str]:
+        rendered = client.subscription.render(kind, data)
+        if rendered is None:
+            return None
+        return encode({"type": kind, "seq": seq, "since": client.seq, "data": rendered})
+
+    def _offer_seq(self, client: WebSocketClient, seq: int, kind: str, data: Any) -> None:
+        encoded = self._encode_seq(client, seq, kind, data)
+        if encoded is not None:
+            client.seq = seq
+            self._offer(client, encoded)
+
+    def _offer(self, client: WebSocketClient, encoded: str) -> bool:
+        if client.offer(encoded):
+            return True
+        # Too slow to keep up even with downgrading: cut it loose
+        if client.writer is not None:
+            client.writer.cancel()
+        asyncio.create_task(self._close(client, code=1013))
+        return False
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,328 @@
+"""
+Event Ingestion
+---------------
+Streams SupplyChainEvent records from NDJSON or CSV request bodies into the
+database. Records are parsed line by line as chunks arrive, validated, and
+written in multi-row INSERT batches of INGEST_BATCH_SIZE, so memory stays
+bounded by one batch regardless of body size.
+
+After ingestion only the event-driven leaves touched by the ingested event
+types are re-aggregated; the current tree state is updated incrementally
+from those leaves and persisted as a new snapshot.
+"""
+import csv
+import json
+import math
+import os
+from datetime import date, datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models.db_models import Supplier, SupplyChainEvent, gen_uuid
+from services.alert_engine import persist_metric_snapshot
+from services.leaf_scoring import leaves_for_event_types, rescore_leaves
+from services.metric_tree import TreeState
+from services.rolling_aggregates import accumulate_events, expire_event_aggregates
+from services.scheduler import scheduler
+from services.tree_state import get_current_tree_state
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+MAX_BATCH_SIZE = 10000
+INGEST_MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", str(1024 * 1024)))
+MAX_REPORTED_ERRORS = 100
+
+EVENT_TYPES = {"wafer_start", "osat_run", "transit", "customs", "goods_receipt"}
+EVENT_STATUSES = {"on_time", "delayed", "critical", "cancelled"}
+
+
+class EventValidationError(ValueError):
+    """Raised for a record that cannot be stored as a SupplyChainEvent."""
+
+
+# ── Parsing ────────────────────────────────────────────────────────────────────
+def _decode(line: bytes):
+    try:
+        return line.rstrip(b"\r").decode("utf-8")
+    except UnicodeDecodeError as e:
+        return EventValidationError(f"invalid UTF-8: {e.reason} at byte {e.start}")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = None) -> AsyncIterator[Any]:
+    """
+    Split a byte stream into decoded lines without buffering more than one
+    partial line. A line that is not valid UTF-8, or is longer than
+    INGEST_MAX_LINE_BYTES (its bytes are discarded as they arrive), comes
+    out as an EventValidationError so only that line is rejected.
+    """
+    limit = max_line_bytes or INGEST_MAX_LINE_BYTES
+    too_long = EventValidationError(f"line longer than {limit} bytes")
+    pending = b""
+    oversized = False
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if oversized or len(line) > limit:
+                oversized = False
+                yield too_long
+            else:
+                yield _decode(line)
+        if len(pending) > limit:
+            oversized, pending = True, b""
+    if oversized:
+        yield too_long
+    elif pending:
+        yield _decode(pending)
+
+
+async def parse_ndjson(lines: AsyncIterator[Any]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (line_no, record dict or EventValidationError) per non-blank line."""
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if isinstance(line, EventValidationError):
+            yield line_no, line
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, EventValidationError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_no, EventValidationError("expected a JSON object")
+            continue
+        yield line_no, record
+
+
+async def parse_csv(lines: AsyncIterator[Any]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yield (line_no, record dict or EventValidationError) per CSV record; the
+    first record is the header. Quoted fields may span lines.
+    """
+    header: Optional[List[str]] = None
+    record, start, line_no = "", 0, 0
+    async for line in lines:
+        line_no += 1
+        if isinstance(line, EventValidationError):
+            # Drops the record the line belongs to
+            yield (start if record else line_no), line
+            record = ""
+            continue
+        if not record:
+            start = line_no
+            if not line.strip():
+                continue
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue  # inside a quoted field
+        values = next(csv.reader([record]))
+        record = ""
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        if len(values) != len(header):
+            yield start, EventValidationError(f"expected {len(header)} columns, got {len(values)}")
+            continue
+        yield start, {k: v for k, v in zip(header, values) if v != ""}
+    if record:
+        yield start, EventValidationError("unterminated quoted field")
+
+
+# ── Validation ─────────────────────────────────────────────────────────────────
+def _int(value) -> int:
+    if isinstance(value, bool):
+        raise ValueError("not an integer")
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError("not an integer")
+    return int(value)
+
+
+def _float(value) -> float:
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("not a finite number")
+    return number
+
+
+def _date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _datetime(value) -> datetime:
+    """Naive UTC, converting offset-aware values rather than dropping the offset."""
+    t = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo else t
+
+
+# column → coercion
+EVENT_FIELDS = {
+    "event_id": str,
+    "supplier_id": str,
+    "oem_id": str,
+    "event_type": str,
+    "chip_part_number": str,
+    "chip_node": str,
+    "chip_application": str,
+    "planned_date": _date,
+    "actual_date": _date,
+    "delay_days": _int,
+    "quantity_ordered": _int,
+    "quantity_delivered": _int,
+    "defect_ppm": _float,
+    "event_status": str,
+    "disruption_type": str,
+    "recorded_at": _datetime,
+}
+
+
+def validate_event(record: Dict[str, Any], supplier_ids: Set[str], now: datetime) -> Dict[str, Any]:
+    """Coerce one raw record into an insertable row, or raise EventValidationError."""
+    unknown = set(record) - set(EVENT_FIELDS)
+    if unknown:
+        raise EventValidationError(f"unknown field(s): {', '.join(sorted(unknown))}")
+
+    row: Dict[str, Any] = {}
+    for field, coerce in EVENT_FIELDS.items():
+        value = record.get(field)
+        if value is None:
+            continue
+        try:
+            row[field] = coerce(value)
+        except (TypeError, ValueError):
+            raise EventValidationError(f"invalid {field}: {value!r}")
+
+    if row.get("event_type") not in EVENT_TYPES:
+        raise EventValidationError(f"event_type must be one of {', '.join(sorted(EVENT_TYPES))}")
+    if "event_status" in row and row["event_status"] not in EVENT_STATUSES:
+        raise EventValidationError(f"event_status must be one of {', '.join(sorted(EVENT_STATUSES))}")
+    if "supplier_id" in row and row["supplier_id"] not in supplier_ids:
+        raise EventValidationError(f"unknown supplier_id: {row['supplier_id']}")
+    for field in ("quantity_ordered", "quantity_delivered", "defect_ppm"):
+        if row.get(field, 0) < 0:
+            raise EventValidationError(f"{field} must be >= 0")
+
+    row.setdefault("event_id", gen_uuid())
+    row.setdefault("delay_days", 0)
+    row.setdefault("defect_ppm", 0.0)
+    row.setdefault("recorded_at", now)
+    return row
+
+
+# ── Writing ────────────────────────────────────────────────────────────────────
+def write_batch(db: Session, rows: List[Dict[str, Any]]) -> Tuple[int, List[Tuple[int, str]]]:
+    """
+    Insert one batch as a single executemany, add it to the rolling event
+    aggregates in the same transaction and commit. If the batch hits
+    a constraint (e.g. a duplicate event_id), rows are retried one by one
+    so only the offending ones are rejected. ``rows`` carry their source
+    line under "_line". Returns (accepted, [(line_no, error)]).
+    """
+    # executemany needs every row to bind the same columns
+    values = [{field: row.get(field) for field in EVENT_FIELDS} for row in rows]
+    try:
+        with db.begin_nested():
+            db.execute(insert(SupplyChainEvent), values)
+        accumulate_events(db, [v["event_id"] for v in values])
+        db.commit()
+        return len(rows), []
+    except IntegrityError:
+        pass
+
+    accepted, errors = [], []
+    for row, value in zip(rows, values):
+        try:
+            with db.begin_nested():
+                db.execute(insert(SupplyChainEvent), [value])
+            accepted.append(value["event_id"])
+        except IntegrityError as e:
+            errors.append((row["_line"], f"rejected by database: {e.orig}"))
+    accumulate_events(db, accepted)
+    db.commit()
+    return len(accepted), errors
+
+
+def rescore_after_ingest(db: Session, event_types: Set[str]) -> Dict[str, Any]:
+    """
+    Re-aggregate only the leaves fed by ``event_types``, apply them to the
+    current tree state incrementally and persist the result if anything moved.
+    """
+    leaf_ids = leaves_for_event_types(event_types)
+    fresh = rescore_leaves(db, "events", leaf_ids)
+    if not fresh:
+        return {"rescored_leaves": [], "changed_nodes": []}
+
+    current = get_current_tree_state(db)
+    state = TreeState(current.tree, current.result.scores)
+    changed = state.update_leaves(fresh)
+    if changed:
+        persist_metric_snapshot(db, state.to_scores())
+    return {"rescored_leaves": sorted(fresh), "changed_nodes": state.delta(changed)}
+
+
+def _supplier_ids(db: Session) -> Set[str]:
+    return {s for (s,) in db.query(Supplier.supplier_id).all()}
+
+
+async def ingest_events(
+    db: Session, records: AsyncIterator[Tuple[int, Any]], batch_size: int = INGEST_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Validate parsed records and write them batch by batch (DB work runs in
+    the threadpool), then rescore the affected leaves once at the end.
+    """
+    supplier_ids = await run_in_threadpool(_supplier_ids, db)
+    now = datetime.utcnow()
+    batches: List[Dict[str, int]] = []
+    errors: List[Dict[str, Any]] = []
+    event_types: Set[str] = set()
+    rows: List[Dict[str, Any]] = []
+    rejected = 0
+
+    def report(line_no: int, message: str) -> None:
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": message})
+
+    async def flush() -> None:
+        nonlocal rows, rejected
+        accepted, failed = await run_in_threadpool(write_batch, db, rows) if rows else (0, [])
+        for line_no, message in failed:
+            report(line_no, message)
+        batches.append({"batch": len(batches) + 1, "accepted": accepted, "rejected": rejected + len(failed)})
+        event_types.update(row["event_type"] for row in rows)
+        rows, rejected = [], 0
+
+    async for line_no, record in records:
+        if isinstance(record, EventValidationError):
+            report(line_no, str(record))
+            rejected += 1
+        else:
+            try:
+                row = validate_event(record, supplier_ids, now)
+                row["_line"] = line_no
+                rows.append(row)
+            except EventValidationError as e:
+                report(line_no, str(e))
+                rejected += 1
+        if len(rows) + rejected >= batch_size:
+            await flush()
+    if rows or rejected:
+        await flush()
+    await run_in_threadpool(expire_event_aggregates, db)
+
+    rescoring = await run_in_threadpool(rescore_after_ingest, db, event_types) if event_types else {
+        "rescored_leaves": [], "changed_nodes": []}
+    if event_types:
+        scheduler.trigger()
+    return {
+        "accepted": sum(b["accepted"] for b in batches),
+        "rejected": sum(b["rejected"] for b in batches),
+        "batches": batches,
+        "errors": errors,
+        **rescoring,
+    }
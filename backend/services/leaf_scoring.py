@@ -0,0 +1,273 @@
+"""
+Leaf Scoring
+------------
+Derives leaf scores from live supply chain data. Each leaf declares one
+aggregation over a source table (SupplyChainEvent, InventoryPosition,
+MacroRiskSignal, Supplier) and a mapping from the aggregated value to a
+0-100 score.
+
+All leaves of a source are computed by a single query of conditional
+aggregates, so scoring the whole tree costs one query per source; with a
+slice dimension the same query gains a GROUP BY and yields one row per
+slice key. Leaves without a scorer, or without data, are left out and
+fall back to DEFAULT_SCORE during propagation.
+
+Event leaves only look at the last EVENT_WINDOW_DAYS of events. Whole-tree
+scores for them are read from the rolling day buckets in
+services.rolling_aggregates rather than from the events table. Fab downtime
+and yield crash leaves use the same window over signal_date.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Date, and_, case, func
+from sqlalchemy.orm import Session
+
+from models.db_models import InventoryPosition, MacroRiskSignal, Supplier, SupplyChainEvent
+from services.metric_tree import CompiledTree, get_tree
+
+
+# ── Value → score mappings (vectorised, NaN passes through) ────────────────────
+def _penalty(per_unit: float) -> Callable[[np.ndarray], np.ndarray]:
+    """100 minus ``per_unit`` points per unit of the value (delays, ppm, severity)."""
+    return lambda v: np.clip(100.0 - np.maximum(v, 0.0) * per_unit, 0.0, 100.0)
+
+
+def _scaled(factor: float) -> Callable[[np.ndarray], np.ndarray]:
+    """``factor`` points per unit of the value, capped at 100 (coverage, health)."""
+    return lambda v: np.clip(v * factor, 0.0, 100.0)
+
+
+def _cover(target_days: float) -> Callable[[np.ndarray], np.ndarray]:
+    """Days of cover as a share of the target buffer."""
+    return _scaled(100.0 / target_days)
+
+
+def _max_or_zero(expression):
+    """Max severity of open signals; no open signal means no risk."""
+    return func.coalesce(func.max(expression), 0.0)
+
+
+def _share(condition):
+    return case((condition, 1.0), else_=0.0)
+
+
+# ── Sources ────────────────────────────────────────────────────────────────────
+EVENT_WINDOW_DAYS = int(os.getenv("EVENT_WINDOW_DAYS", "90"))
+
+# Day an event counts towards: when it happened, else when it was planned, else when it was recorded
+EVENT_DAY = func.coalesce(
+    SupplyChainEvent.actual_date, SupplyChainEvent.planned_date, func.date(SupplyChainEvent.recorded_at),
+    type_=Date,
+)
+
+
+def _in_event_window():
+    return EVENT_DAY >= datetime.utcnow().date() - timedelta(days=EVENT_WINDOW_DAYS)
+
+
+# source → (model, base filter factory or None, slice dimension → column)
+SOURCES = {
+    "events": (SupplyChainEvent, _in_event_window, {
+        "oem": SupplyChainEvent.oem_id,
+        "supplier": SupplyChainEvent.supplier_id,
+        "sku": SupplyChainEvent.chip_part_number,
+    }),
+    "inventory": (InventoryPosition, None, {
+        "supplier": InventoryPosition.supplier_id,
+        "sku": InventoryPosition.chip_part_number,
+    }),
+    "macro": (MacroRiskSignal, lambda: MacroRiskSignal.resolved.is_(False), {}),
+    "supplier": (Supplier, None, {}),
+}
+
+_fill_rate = SupplyChainEvent.quantity_delivered * 1.0 / func.nullif(SupplyChainEvent.quantity_ordered, 0)
+
+
+class LeafScorer(NamedTuple):
+    source: str
+    aggregate: Callable
+    expression: Any
+    condition: Any                      # extra row condition, or None
+    score: Callable[[np.ndarray], np.ndarray]
+    event_type: Optional[str] = None    # events leaves: the one event_type aggregated (None: every type)
+    window: Any = None                  # date column limiting rows to the last EVENT_WINDOW_DAYS
+
+    @property
+    def row_condition(self):
+        """Rows the aggregate covers, or None for every row of the source."""
+        conditions = [] if self.condition is None else [self.condition]
+        if self.event_type is not None:
+            conditions.append(SupplyChainEvent.event_type == self.event_type)
+        if self.window is not None:
+            conditions.append(self.window >= datetime.utcnow().date() - timedelta(days=EVENT_WINDOW_DAYS))
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else and_(*conditions)
+
+
+# leaf_id → (source, aggregate, value expression, row condition or None, value → score[, event_type])
+#
+# Events leaves are windowed by the events source itself and read from the
+# rolling day buckets. Signal-count style macro leaves are windowed over
+# signal_date instead; they are a max over unresolved signals, which cannot
+# be kept in additive buckets (resolving a signal would have to lower an
+# earlier day's max), and the signals table is small enough to aggregate
+# directly.
+LEAF_SCORERS = {
+    # Delivery — average delay per pipeline stage
+    "delivery.lead_time.wafer_cycle": (
+        "events", func.avg, SupplyChainEvent.delay_days, None, _penalty(4.0), "wafer_start"),
+    "delivery.lead_time.osat_duration": (
+        "events", func.avg, SupplyChainEvent.delay_days, None, _penalty(4.0), "osat_run"),
+    "delivery.transit.port_congestion": (
+        "events", func.avg, SupplyChainEvent.delay_days, None, _penalty(4.0), "transit"),
+    "resilience.logistics_infra.customs_clearance": (
+        "events", func.avg, SupplyChainEvent.delay_days, None, _penalty(4.0), "customs"),
+    "delivery.oem_readiness.dock_to_stock": (
+        "events", func.avg, SupplyChainEvent.delay_days, None, _penalty(4.0), "goods_receipt"),
+    "delivery.transit.last_mile": (
+        "events", func.avg, _fill_rate, None, _scaled(100.0), "goods_receipt"),
+    "quality.chip_quality.reject_rate": (
+        "events", func.avg, SupplyChainEvent.defect_ppm, None, _penalty(0.25)),
+
+    # Buffers — days of cover per stock type, contract vs spot exposure
+    "resilience.demand_shock.tier1_finished_goods": (
+        "inventory", func.avg, InventoryPosition.days_of_cover,
+        InventoryPosition.stock_type == "finished_goods", _cover(30.0)),
+    "resilience.demand_shock.wip_buffer": (
+        "inventory", func.avg, InventoryPosition.days_of_cover,
+        InventoryPosition.stock_type == "wip_osat", _cover(30.0)),
+    "resilience.demand_shock.die_bank": (
+        "inventory", func.avg, InventoryPosition.days_of_cover,
+        InventoryPosition.stock_type == "die_bank", _cover(45.0)),
+    "resilience.demand_shock.lta_utilization": (
+        "inventory", func.avg, InventoryPosition.lta_coverage_pct, None, _scaled(1.0)),
+    "resilience.demand_shock.spot_dependency": (
+        "inventory", func.avg, InventoryPosition.spot_exposure_pct, None, _penalty(2.0)),
+
+    # Early warning — worst open macro signal
+    "resilience.early_warning.macro_overlay": (
+        "macro", _max_or_zero, MacroRiskSignal.severity_score, None, _penalty(1.0)),
+    "resilience.early_warning.fab_downtime": LeafScorer(
+        "macro", _max_or_zero, MacroRiskSignal.severity_score,
+        MacroRiskSignal.signal_type == "fab_downtime", _penalty(1.0), window=MacroRiskSignal.signal_date),
+    "resilience.early_warning.yield_crash": LeafScorer(
+        "macro", _max_or_zero, MacroRiskSignal.severity_score,
+        MacroRiskSignal.signal_type == "yield_crash", _penalty(1.0), window=MacroRiskSignal.signal_date),
+    "resilience.logistics_infra.taiwan_strait_exposure": (
+        "macro", _max_or_zero, MacroRiskSignal.severity_score,
+        MacroRiskSignal.affected_region == "Taiwan", _penalty(1.0)),
+    "resilience.logistics_infra.tariff_exposure": (
+        "macro", _max_or_zero, MacroRiskSignal.severity_score,
+        MacroRiskSignal.signal_type == "export_restriction", _penalty(1.0)),
+
+    # Supplier base — concentration and financial health
+    "resilience.fab_concentration.geo_index.taiwan_pct": (
+        "supplier", func.avg, _share(Supplier.country == "Taiwan"), Supplier.tier == 2, _penalty(100.0)),
+    "resilience.fab_concentration.geo_index.china_pct": (
+        "supplier", func.avg, _share(Supplier.country == "China"), Supplier.tier == 2, _penalty(100.0)),
+    "resilience.fab_concentration.geo_index.japan_korea_pct": (
+        "supplier", func.avg, _share(Supplier.country.in_(("Japan", "South Korea"))), Supplier.tier == 2,
+        _penalty(50.0)),
+    "resilience.osat.package_concentration": (
+        "supplier", func.avg, _share(Supplier.is_single_source.is_(True)), Supplier.tier == 2, _penalty(100.0)),
+    "resilience.osat.financial_health": (
+        "supplier", func.avg, Supplier.financial_health_score, Supplier.tier == 2, _scaled(1.0)),
+    "resilience.early_warning.supplier_financial_stress": (
+        "supplier", func.min, Supplier.financial_health_score, Supplier.tier.in_((2, 3)), _scaled(1.0)),
+    # resilience.material.wafer_supplier_count stays unscored: wafer suppliers share
+    # tier 2 with foundries and OSATs and Supplier has no category to pick them out
+}
+LEAF_SCORERS = {leaf_id: LeafScorer(*spec) for leaf_id, spec in LEAF_SCORERS.items()}
+
+
+def scored_leaves(source: str, tree: CompiledTree) -> List[str]:
+    """Leaves of ``tree`` that ``source`` scores, in LEAF_SCORERS order."""
+    return [leaf_id for leaf_id, spec in LEAF_SCORERS.items() if spec.source == source and leaf_id in tree.index]
+
+
+def aggregate_source(
+    db: Session, source: str, leaf_ids: Sequence[str], dimension: Optional[str] = None,
+) -> Tuple[list, List[int], np.ndarray]:
+    """
+    One query computing every listed leaf's aggregate over ``source``,
+    grouped by ``dimension`` when given (supplier slices are limited to
+    Tier-1 suppliers). Returns (keys, row_counts, values) where values is
+    (keys × leaf_ids) with NaN where a key had no matching rows; without a
+    dimension there is a single key, None.
+    """
+    model, base_filter, dimensions = SOURCES[source]
+    aggregates = []
+    for leaf_id in leaf_ids:
+        spec = LEAF_SCORERS[leaf_id]
+        condition = spec.row_condition
+        aggregates.append(spec.aggregate(spec.expression if condition is None else case((condition, spec.expression))))
+
+    count = func.count()
+    if dimension is None:
+        q = db.query(count, *aggregates).select_from(model)
+    else:
+        column = dimensions[dimension]
+        q = db.query(column, count, *aggregates).filter(column.isnot(None)).group_by(column)
+        if dimension == "supplier":
+            q = q.join(Supplier, Supplier.supplier_id == column).filter(Supplier.tier == 1)
+    if base_filter is not None:
+        q = q.filter(base_filter())
+    rows = q.all()
+
+    if dimension is None:
+        rows = [(None, *r) for r in rows]
+    keys = [r[0] for r in rows]
+    counts = [r[1] for r in rows]
+    values = np.array([[np.nan if v is None else float(v) for v in r[2:]] for r in rows], dtype=np.float64)
+    return keys, counts, values.reshape(len(rows), len(leaf_ids))
+
+
+def score_values(leaf_ids: Sequence[str], values: np.ndarray) -> np.ndarray:
+    """Map an aggregate matrix (rows × leaf_ids) to leaf scores column by column."""
+    scores = np.empty_like(values)
+    for j, leaf_id in enumerate(leaf_ids):
+        scores[:, j] = LEAF_SCORERS[leaf_id].score(values[:, j])
+    return scores
+
+
+def leaves_for_event_types(event_types: Sequence[str], tree: CompiledTree = None) -> List[str]:
+    """Events-sourced leaves whose aggregate can change when events of ``event_types`` arrive."""
+    tree = tree or get_tree()
+    event_types = set(event_types)
+    affected = []
+    for leaf_id in scored_leaves("events", tree):
+        event_type = LEAF_SCORERS[leaf_id].event_type
+        if event_types and (event_type is None or event_type in event_types):
+            affected.append(leaf_id)
+    return affected
+
+
+def rescore_leaves(db: Session, source: str, leaf_ids: Sequence[str]) -> Dict[str, float]:
+    """Fresh scores for just ``leaf_ids`` of one source, in one query."""
+    if not leaf_ids:
+        return {}
+    if source == "events":
+        from services.rolling_aggregates import windowed_event_scores
+        return windowed_event_scores(db, leaf_ids)
+    _, counts, values = aggregate_source(db, source, leaf_ids)
+    if not counts:
+        return {}
+    # Even with no rows, coalesced aggregates (no open signal ⇒ 0) still score
+    return {
+        leaf_id: score
+        for leaf_id, score in zip(leaf_ids, score_values(leaf_ids, values)[0].tolist())
+        if score == score  # NaN: no rows matched this leaf
+    }
+
+
+def live_leaf_scores(db: Session, tree: CompiledTree = None) -> Dict[str, float]:
+    """Leaf scores derived from current table contents, one query per source."""
+    tree = tree or get_tree()
+    scores: Dict[str, float] = {}
+    for source in SOURCES:
+        scores.update(rescore_leaves(db, source, scored_leaves(source, tree)))
+    return scores
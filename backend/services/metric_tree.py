@@ -3,10 +3,17 @@ Metric Tree Engine
 ------------------
 Builds the full supply chain metric tree, scores every node,
 propagates failures upward, and returns structured alerts.
+
+The tree definition is compiled once into an array-backed form
+(integer node indices, parent array, CSR child lists, normalized
+weights, bottom-up level passes) so scoring never rebuilds a graph.
 """
-import networkx as nx
+import hashlib
+import json
+import numpy as np
+from collections.abc import Mapping
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Set, Tuple
 
 # ── Tree Definition ────────────────────────────────────────────────────────────
 # node_id → { label, parent, weight, leaf }
@@ -126,6 +133,11 @@ METRIC_TREE_DEFINITION = {
 
 RED_THRESHOLD = 40
 AMBER_THRESHOLD = 70
+DEFAULT_SCORE = 75.0
+
+# uint8 status codes used by the batch / array APIs
+STATUS_GREEN, STATUS_AMBER, STATUS_RED = 0, 1, 2
+STATUS_LABELS = ("green", "amber", "red")
 
 
 def compute_status(score: float) -> str:
@@ -136,95 +148,518 @@ def compute_status(score: float) -> str:
     return "red"
 
 
-def build_graph() -> nx.DiGraph:
-    G = nx.DiGraph()
-    for node_id, meta in METRIC_TREE_DEFINITION.items():
-        G.add_node(node_id, **meta)
-    for node_id, meta in METRIC_TREE_DEFINITION.items():
-        if meta["parent"]:
-            G.add_edge(meta["parent"], node_id, weight=meta["weight"])
-    return G
+def compute_status_codes(scores: np.ndarray) -> np.ndarray:
+    """Vectorized compute_status: returns STATUS_* codes with the same shape as scores."""
+    codes = np.full(np.shape(scores), STATUS_GREEN, dtype=np.uint8)
+    codes[scores < AMBER_THRESHOLD] = STATUS_AMBER
+    codes[scores < RED_THRESHOLD] = STATUS_RED
+    return codes
+
+
+# ── Compiled Tree ──────────────────────────────────────────────────────────────
+NODE_FIELDS = ("label", "parent", "weight", "leaf")
 
 
-def get_leaf_nodes() -> List[str]:
-    return [n for n, d in METRIC_TREE_DEFINITION.items() if d["leaf"]]
+def _json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
 
 
-def propagate_scores(leaf_scores: Dict[str, float]) -> Dict[str, Any]:
+def definition_hash(definition: Dict[str, Dict[str, Any]]) -> str:
+    """Content hash of a tree definition; node order is significant, extra keys are not."""
+    canonical = [[node_id] + [meta[k] for k in NODE_FIELDS] for node_id, meta in definition.items()]
+    return hashlib.sha256(json.dumps(canonical, separators=(",", ":")).encode()).hexdigest()
+
+
+class CompiledTree:
     """
-    Given leaf scores (node_id → score 0-100), propagate up the tree.
-    Returns all node scores including internal nodes.
+    Immutable, array-backed form of a tree definition.
+
+    Node indices follow definition order. The children of node ``i`` are
+    ``child_idx[child_ptr[i]:child_ptr[i + 1]]`` (CSR layout) with matching
+    sibling-normalized weights in ``child_weight``. ``levels`` holds one
+    vectorized aggregation pass per tree depth, deepest first.
     """
-    G = build_graph()
-    scores = dict(leaf_scores)
 
-    # Bottom-up traversal using reverse topological sort
-    for node in reversed(list(nx.topological_sort(G))):
-        if METRIC_TREE_DEFINITION[node]["leaf"]:
-            if node not in scores:
-                scores[node] = 75.0  # default if missing
-            continue
-        children = list(G.successors(node))
-        if not children:
-            continue
-        total_weight = sum(METRIC_TREE_DEFINITION[c]["weight"] for c in children)
-        weighted_sum = sum(
-            scores.get(c, 75.0) * METRIC_TREE_DEFINITION[c]["weight"]
-            for c in children
+    def __init__(self, definition: Dict[str, Dict[str, Any]]):
+        self.definition = definition
+        self.version = definition_hash(definition)
+        self.node_ids: List[str] = list(definition)
+        self.index: Dict[str, int] = {n: i for i, n in enumerate(self.node_ids)}
+        n = len(self.node_ids)
+
+        self.labels = [definition[x]["label"] for x in self.node_ids]
+        self.parent_ids = [definition[x]["parent"] for x in self.node_ids]
+        self.weights = np.array([definition[x]["weight"] for x in self.node_ids], dtype=np.float64)
+        self.is_leaf = np.array([bool(definition[x]["leaf"]) for x in self.node_ids], dtype=bool)
+        self.parent = np.array(
+            [self.index[p] if p else -1 for p in self.parent_ids], dtype=np.int32
         )
-        scores[node] = weighted_sum / total_weight if total_weight else 75.0
+        self.root = int(np.flatnonzero(self.parent < 0)[0])
+
+        children: List[List[int]] = [[] for _ in range(n)]
+        for i, p in enumerate(self.parent):
+            if p >= 0:
+                children[p].append(i)
+        self.children = [tuple(c) for c in children]
+
+        # CSR child lists with weights normalized over siblings
+        self.child_ptr = np.zeros(n + 1, dtype=np.int32)
+        self.child_ptr[1:] = np.cumsum([len(c) for c in children])
+        self.child_idx = np.array([c for cs in children for c in cs], dtype=np.int32)
+        self.norm_weight = np.ones(n, dtype=np.float64)
+        for cs in children:
+            total = float(self.weights[list(cs)].sum()) if cs else 0.0
+            for c in cs:
+                self.norm_weight[c] = self.weights[c] / total if total else 0.0
+        self.child_weight = self.norm_weight[self.child_idx] if n else np.zeros(0)
+
+        self.depth = np.zeros(n, dtype=np.int32)
+        for i in range(n):
+            d, p = 0, self.parent[i]
+            while p >= 0:
+                d, p = d + 1, self.parent[p]
+            self.depth[i] = d
+
+        self.leaf_idx = np.flatnonzero(self.is_leaf)
+        self.leaf_ids = [self.node_ids[i] for i in self.leaf_idx]
+
+        # Pre-order layout: node i's subtree is preorder[pre_pos[i]:subtree_end[i]]
+        self.preorder = np.zeros(n, dtype=np.int32)
+        self.pre_pos = np.zeros(n, dtype=np.int32)
+        self.subtree_end = np.zeros(n, dtype=np.int32)
+        pos, stack = 0, [(self.root, False)] if n else []
+        while stack:
+            i, done = stack.pop()
+            if done:
+                self.subtree_end[i] = pos
+                continue
+            self.preorder[pos], self.pre_pos[i] = i, pos
+            pos += 1
+            stack.append((i, True))
+            stack.extend((c, False) for c in reversed(children[i]))
+
+        # Static per-node metadata shared by every TreeResult, including the
+        # pre-encoded JSON around the two fields that change per evaluation.
+        leaf_flags = self.is_leaf.tolist()
+        weight_list = self.weights.tolist()
+        self.node_meta = [
+            (node_id, self.labels[i], self.parent_ids[i], leaf_flags[i], weight_list[i])
+            for i, node_id in enumerate(self.node_ids)
+        ]
+        self.json_head = [
+            _json({"node_id": node_id, "label": label, "parent": parent})[:-1] + ","
+            for node_id, label, parent, _, _ in self.node_meta
+        ]
+        self.json_tail = [
+            "," + _json({"leaf": leaf, "weight": weight})[1:-1] + ","
+            for _, _, _, leaf, weight in self.node_meta
+        ]
+
+        # Bottom-up passes: every parent at depth d is aggregated from its
+        # children in one np.add.reduceat call, deepest level first.
+        self.levels = []
+        max_depth = int(self.depth.max()) if n else 0
+        for d in range(max_depth - 1, -1, -1):
+            parents = [
+                i for i in range(n)
+                if self.depth[i] == d and children[i] and not self.is_leaf[i]
+                and self.child_weight[self.child_ptr[i]:self.child_ptr[i + 1]].sum() > 0
+            ]
+            if not parents:
+                continue
+            edge_child = np.concatenate([self.child_idx[self.child_ptr[i]:self.child_ptr[i + 1]] for i in parents])
+            starts = np.cumsum([0] + [len(children[i]) for i in parents[:-1]])
+            self.levels.append((
+                np.array(parents, dtype=np.int32),
+                edge_child,
+                self.norm_weight[edge_child],
+                starts.astype(np.int32),
+            ))
+
+        # The tree is a linear aggregation, so node scores are an affine map of
+        # the leaf vector: scores = influence @ leaves + offset. Column j of
+        # ``influence`` is the effective weight of leaf j on every node.
+        base = np.full((1, n), DEFAULT_SCORE)
+        base[0, self.leaf_idx] = 0.0
+        self.offset = self._propagate_rows(base)[0]
+        unit = np.repeat(base, len(self.leaf_idx), axis=0)
+        unit[np.arange(len(self.leaf_idx)), self.leaf_idx] = 1.0
+        self.influence = (self._propagate_rows(unit) - self.offset).T
+        self.influence[np.abs(self.influence) < 1e-15] = 0.0
+        self._influence_t = np.ascontiguousarray(self.influence.T)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def definition_json(self) -> bytes:
+        """Pre-serialized /tree-definition body; immutable for the life of this tree."""
+        body = getattr(self, "_definition_json", None)
+        if body is None:
+            body = self._definition_json = _json({
+                "version": self.version,
+                "nodes": [{"node_id": k, **v} for k, v in self.definition.items()],
+            }).encode()
+        return body
+
+    def subtree(self, node_id: str, depth: Optional[int] = None) -> List[int]:
+        """Indices of ``node_id`` and its descendants up to ``depth`` levels below it, in definition order."""
+        i = self.index[node_id]
+        members = self.preorder[self.pre_pos[i]:self.subtree_end[i]]
+        if depth is not None:
+            members = members[self.depth[members] <= self.depth[i] + depth]
+        return np.sort(members).tolist()
+
+    def propagate(self, leaf_scores: Dict[str, float]) -> np.ndarray:
+        """Score every node from a leaf_id → score mapping; returns a node-indexed array."""
+        scores = np.full(len(self.node_ids), DEFAULT_SCORE, dtype=np.float64)
+        index, is_leaf = self.index, self.is_leaf
+        for node_id, score in leaf_scores.items():
+            i = index.get(node_id)
+            if i is not None and is_leaf[i]:
+                scores[i] = score
+        for parents, edge_child, edge_weight, starts in self.levels:
+            scores[parents] = np.add.reduceat(scores[edge_child] * edge_weight, starts)
+        return scores
+
+    def _propagate_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Run the level passes over an (N × nodes) matrix whose leaf columns are set."""
+        rows = np.array(rows, dtype=np.float64)
+        for parents, edge_child, edge_weight, starts in self.levels:
+            rows[:, parents] = np.add.reduceat(rows[:, edge_child] * edge_weight, starts, axis=1)
+        return rows
+
+    def leaf_matrix(self, rows: Sequence[Dict[str, float]]) -> np.ndarray:
+        """Pack leaf_id → score mappings into an (N × leaves) matrix; missing leaves are NaN."""
+        matrix = np.full((len(rows), len(self.leaf_ids)), np.nan)
+        column = {node_id: j for j, node_id in enumerate(self.leaf_ids)}
+        for r, leaf_scores in enumerate(rows):
+            for node_id, score in leaf_scores.items():
+                j = column.get(node_id)
+                if j is not None:
+                    matrix[r, j] = score
+        return matrix
+
+
+# The active tree is swapped as a whole by services.tree_registry; callers
+# that need a consistent view for a whole request grab it once via get_tree()
+# and pass it down explicitly.
+_active_tree = CompiledTree(METRIC_TREE_DEFINITION)
+
+
+def get_tree() -> CompiledTree:
+    return _active_tree
+
+
+def set_tree(tree: CompiledTree) -> None:
+    global _active_tree
+    _active_tree = tree
+
+
+def get_leaf_nodes(tree: CompiledTree = None) -> List[str]:
+    return list((tree or get_tree()).leaf_ids)
+
+
+# ── Results ────────────────────────────────────────────────────────────────────
+class TreeResult(Mapping):
+    """
+    Struct-of-arrays result of one evaluation: float scores and uint8
+    STATUS_* codes indexed like ``tree.node_ids``, with labels, parents and
+    weights read from the compiled tree rather than copied per result.
 
-    result = {}
-    for node_id, score in scores.items():
-        meta = METRIC_TREE_DEFINITION[node_id]
-        result[node_id] = {
+    Behaves as a read-only node_id → node dict mapping for existing callers;
+    each node dict is built only when it is accessed, and to_json()
+    serializes straight from the arrays.
+    """
+
+    __slots__ = ("tree", "scores", "codes", "_rounded")
+
+    def __init__(self, tree: CompiledTree, scores: np.ndarray, codes: np.ndarray = None):
+        self.tree = tree
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.codes = compute_status_codes(self.scores) if codes is None else codes
+        self._rounded = None
+
+    @property
+    def rounded(self) -> List[float]:
+        """Scores rounded to 2 dp, the precision every API response uses."""
+        if self._rounded is None:
+            self._rounded = [round(x, 2) for x in self.scores.tolist()]
+        return self._rounded
+
+    def __getitem__(self, node_id: str) -> Dict[str, Any]:
+        return self.node(self.tree.index[node_id])
+
+    def __iter__(self):
+        return iter(self.tree.node_ids)
+
+    def __len__(self) -> int:
+        return len(self.tree.node_ids)
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self.tree.index
+
+    def node(self, i: int) -> Dict[str, Any]:
+        node_id, label, parent, leaf, weight = self.tree.node_meta[i]
+        status = STATUS_LABELS[self.codes[i]]
+        return {
             "node_id": node_id,
-            "label": meta["label"],
-            "parent": meta["parent"],
+            "label": label,
+            "parent": parent,
+            "score": self.rounded[i],
+            "status": status,
+            "leaf": leaf,
+            "weight": weight,
+            "flagged": status == "red",
+        }
+
+    def score(self, node_id: str) -> float:
+        return self.rounded[self.tree.index[node_id]]
+
+    def status(self, node_id: str) -> str:
+        return STATUS_LABELS[self.codes[self.tree.index[node_id]]]
+
+    def indices(self, status_code: int) -> List[int]:
+        return np.flatnonzero(self.codes == status_code).tolist()
+
+    def worst_index(self, status_code: int) -> Optional[int]:
+        """Lowest-scoring node with the given status, or None."""
+        candidates = self.indices(status_code)
+        return min(candidates, key=self.rounded.__getitem__) if candidates else None
+
+    def changed_indices(self, previous: "TreeResult") -> List[int]:
+        """Nodes whose rounded score or status differs from ``previous`` (an evaluation of the same tree)."""
+        moved = np.array(self.rounded) != np.array(previous.rounded)
+        return np.flatnonzero(moved | (self.codes != previous.codes)).tolist()
+
+    def delta(self, indices: Iterable[int]) -> List[Dict[str, Any]]:
+        """Compact node_id/score/status entries for ``indices``, as in TreeState.delta."""
+        node_ids, rounded = self.tree.node_ids, self.rounded
+        return [
+            {"node_id": node_ids[i], "score": rounded[i], "status": STATUS_LABELS[self.codes[i]]}
+            for i in indices
+        ]
+
+    def nodes(self, indices: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        if indices is None:
+            indices = range(len(self))
+        return [self.node(i) for i in indices]
+
+    def to_json(self, indices: Optional[Iterable[int]] = None) -> str:
+        """JSON array of node objects, assembled from the pre-encoded metadata."""
+        if indices is None:
+            indices = range(len(self))
+        head, tail, rounded = self.tree.json_head, self.tree.json_tail, self.rounded
+        codes = self.codes.tolist()
+        parts = []
+        for i in indices:
+            code = codes[i]
+            parts.append(
+                f'{head[i]}"score":{rounded[i]!r},"status":"{STATUS_LABELS[code]}"'
+                f'{tail[i]}"flagged":{"true" if code == STATUS_RED else "false"}}}'
+            )
+        return "[" + ",".join(parts) + "]"
+
+    def snapshot_json(self, indices: Optional[Iterable[int]] = None, root: Optional[int] = None) -> bytes:
+        """Body of /api/metric-tree/snapshot; ``root`` is the node reported as root_* (tree root by default)."""
+        indices = range(len(self)) if indices is None else list(indices)
+        root = self.tree.root if root is None else root
+        return (
+            f'{{"total_nodes":{len(indices)},"root":"{self.tree.node_ids[root]}",'
+            f'"root_score":{self.rounded[root]!r},"root_status":"{STATUS_LABELS[self.codes[root]]}",'
+            f'"nodes":{self.to_json(indices)}}}'
+        ).encode()
+
+
+def propagate_scores(leaf_scores: Dict[str, float], tree: CompiledTree = None) -> TreeResult:
+    """
+    Given leaf scores (node_id → score 0-100), propagate up the tree.
+    Returns all node scores including internal nodes.
+    """
+    tree = tree or get_tree()
+    return TreeResult(tree, tree.propagate(leaf_scores))
+
+
+def propagate_scores_batch(leaf_matrix: np.ndarray, tree: CompiledTree = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score many trees at once.
+
+    ``leaf_matrix`` is (N × leaves) with columns in ``tree.leaf_ids`` order;
+    NaN entries fall back to DEFAULT_SCORE like missing leaves do in
+    propagate_scores. Returns an (N × nodes) float score matrix, columns in
+    ``tree.node_ids`` order, and the matching uint8 STATUS_* code matrix.
+    """
+    tree = tree or get_tree()
+    leaves = np.asarray(leaf_matrix, dtype=np.float64)
+    if leaves.ndim == 1:
+        leaves = leaves[np.newaxis, :]
+    if leaves.shape[1] != len(tree.leaf_ids):
+        raise ValueError(f"expected {len(tree.leaf_ids)} leaf columns, got {leaves.shape[1]}")
+    leaves = np.where(np.isnan(leaves), DEFAULT_SCORE, leaves)
+    scores = leaves @ tree._influence_t + tree.offset
+    return scores, compute_status_codes(scores)
+
+
+def leaf_influence(leaf_scores: Dict[str, float], node_id: str = "root", tree: CompiledTree = None) -> List[Dict[str, Any]]:
+    """
+    Each leaf's share of ``node_id``'s score, read from the precomputed
+    influence matrix. ``gain_per_point`` is how much the node moves when the
+    leaf improves by one point; ``max_gain`` is the gain if it reached 100.
+    Leaves outside the node's subtree are omitted. Sorted by max_gain.
+    """
+    tree = tree or get_tree()
+    row = tree.influence[tree.index[node_id]].tolist()
+    leaves = tree.propagate(leaf_scores)[tree.leaf_idx].tolist()
+    result = []
+    for j, leaf_id in enumerate(tree.leaf_ids):
+        weight = row[j]
+        if not weight:
+            continue
+        score = leaves[j]
+        result.append({
+            "node_id": leaf_id,
+            "label": tree.labels[tree.index[leaf_id]],
             "score": round(score, 2),
             "status": compute_status(score),
-            "leaf": meta["leaf"],
-            "weight": meta["weight"],
-            "flagged": compute_status(score) == "red",
-        }
+            "gain_per_point": round(weight, 6),
+            "contribution": round(weight * score, 4),
+            "max_gain": round(weight * (100 - score), 4),
+        })
+    result.sort(key=lambda x: x["max_gain"], reverse=True)
     return result
 
 
-def trace_root_cause(all_scores: Dict[str, Any], start: str = "root") -> List[Dict]:
+def trace_root_cause(all_scores: TreeResult, start: str = "root") -> List[Dict]:
     """
     Walk the tree from root, always following the child with the lowest score.
     Returns path from root to the most critical leaf.
     """
+    tree = all_scores.tree
+    scores = all_scores.rounded
     path = []
-    current = start
-    while True:
-        node_data = all_scores.get(current)
-        if not node_data:
-            break
-        path.append(node_data)
-        if METRIC_TREE_DEFINITION[current]["leaf"]:
-            break
-        # Find child with lowest score
-        G = build_graph()
-        children = list(G.successors(current))
+    current = tree.index.get(start)
+    while current is not None:
+        path.append(all_scores.node(current))
+        children = tree.children[current]
         if not children:
             break
-        worst_child = min(children, key=lambda c: all_scores.get(c, {}).get("score", 100))
-        current = worst_child
+        current = min(children, key=scores.__getitem__)
     return path
 
 
-def get_all_alerts(all_scores: Dict[str, Any]) -> List[Dict]:
-    """Return all RED nodes with their root cause traces."""
+def compute_worst_children(tree: CompiledTree, scores: Sequence[float]) -> List[int]:
+    """
+    One sweep over the CSR child lists: worst[i] is the index of node i's
+    lowest-scoring child (first one on ties), or -1 for leaves.
+    """
+    worst = [-1] * len(tree)
+    for i, children in enumerate(tree.children):
+        if children:
+            worst[i] = min(children, key=scores.__getitem__)
+    return worst
+
+
+def get_all_alerts(all_scores: TreeResult) -> List[Dict]:
+    """
+    Return all RED nodes with their root cause traces.
+
+    Worst-child pointers are computed once for the whole tree, and each red
+    node's trace follows them down to a leaf, so the pass is O(nodes).
+    """
+    tree = all_scores.tree
+    node_ids = tree.node_ids
+    scores = all_scores.rounded
+    worst = compute_worst_children(tree, scores)
+    flagged_at = datetime.utcnow().isoformat()
+
     alerts = []
-    for node_id, data in all_scores.items():
-        if data["status"] == "red":
-            trace = trace_root_cause(all_scores, start=node_id) if data["leaf"] else []
-            alerts.append({
-                "node_id": node_id,
-                "label": data["label"],
-                "score": data["score"],
-                "trace": [t["node_id"] for t in trace],
-                "flagged_at": datetime.utcnow().isoformat(),
-            })
+    for i in all_scores.indices(STATUS_RED):
+        trace = []
+        j = i
+        while j >= 0:
+            trace.append(node_ids[j])
+            j = worst[j]
+        alerts.append({
+            "node_id": node_ids[i],
+            "label": tree.labels[i],
+            "score": scores[i],
+            "trace": trace,
+            "flagged_at": flagged_at,
+        })
     return alerts
+
+
+# ── Incremental State ──────────────────────────────────────────────────────────
+class TreeState:
+    """
+    Current scores of one tree, re-propagated incrementally.
+
+    Keeps every node's score and, for internal nodes, the weighted sum of
+    its children. update_leaf only walks the changed leaf's ancestors and
+    stops as soon as a node's score stops moving.
+    """
+
+    def __init__(self, tree: CompiledTree, scores: np.ndarray):
+        self.tree = tree
+        self.scores: List[float] = [float(x) for x in scores]
+        self.weighted_sums: List[float] = [0.0] * len(tree)
+        norm_weight = tree.norm_weight.tolist()
+        for i, children in enumerate(tree.children):
+            self.weighted_sums[i] = sum(self.scores[c] * norm_weight[c] for c in children)
+        self.status: List[str] = [compute_status(x) for x in self.scores]
+        self._parent = tree.parent.tolist()
+        self._norm_weight = norm_weight
+
+    @classmethod
+    def from_leaf_scores(cls, leaf_scores: Dict[str, float], tree: CompiledTree = None) -> "TreeState":
+        tree = tree or get_tree()
+        return cls(tree, tree.propagate(leaf_scores))
+
+    def score(self, node_id: str) -> float:
+        return self.scores[self.tree.index[node_id]]
+
+    def update_leaf(self, node_id: str, score: float) -> Set[str]:
+        """
+        Set one leaf's score and re-propagate its ancestors.
+        Returns the node_ids whose rounded score or status changed.
+        """
+        tree = self.tree
+        i = tree.index.get(node_id)
+        if i is None or not tree.is_leaf[i]:
+            raise KeyError(f"{node_id!r} is not a leaf of the metric tree")
+
+        changed: Set[str] = set()
+        delta = self._set(i, float(score), changed)
+        child, parent = i, self._parent[i]
+        while parent >= 0 and delta:
+            self.weighted_sums[parent] += delta * self._norm_weight[child]
+            delta = self._set(parent, self.weighted_sums[parent], changed)
+            child, parent = parent, self._parent[parent]
+        return changed
+
+    def update_leaves(self, leaf_scores: Dict[str, float]) -> Set[str]:
+        changed: Set[str] = set()
+        for node_id, score in leaf_scores.items():
+            changed |= self.update_leaf(node_id, score)
+        return changed
+
+    def _set(self, i: int, score: float, changed: Set[str]) -> float:
+        old = self.scores[i]
+        self.scores[i] = score
+        status = compute_status(score)
+        if status != self.status[i] or round(score, 2) != round(old, 2):
+            self.status[i] = status
+            changed.add(self.tree.node_ids[i])
+        return score - old
+
+    def delta(self, node_ids: Set[str]) -> List[Dict[str, Any]]:
+        """Compact per-node payload for the given (changed) nodes, in tree order."""
+        index = self.tree.index
+        return [
+            {"node_id": n, "score": round(self.scores[i], 2), "status": self.status[i]}
+            for n, i in sorted(((n, index[n]) for n in node_ids), key=lambda x: x[1])
+        ]
+
+    def to_scores(self) -> TreeResult:
+        """Full propagate_scores-style view of the current state."""
+        return TreeResult(self.tree, np.array(self.scores))
@@ -0,0 +1,133 @@
+"""
+Rolling Aggregates
+------------------
+Per-day buckets of the event-driven leaf aggregates, so windowed leaves
+(e.g. average delay over the last EVENT_WINDOW_DAYS) are read from a
+handful of bucket rows instead of scanning supply_chain_events.
+
+Each bucket holds the sum and count of one leaf's value expression for one
+(leaf, supplier, day). Ingestion adds each committed batch to its buckets
+with a single GROUP BY over the new events plus one upsert; buckets that
+fall out of the window are deleted by expire_event_aggregates. Events
+written outside the ingest path (e.g. the seeder) are picked up with
+rebuild_event_aggregates, which also runs once per process if the store is
+empty.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Sequence
+
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models.db_models import EventLeafAggregate, SupplyChainEvent
+from services.leaf_scoring import EVENT_DAY, EVENT_WINDOW_DAYS, LEAF_SCORERS, score_values
+
+_backfill_checked = False
+
+
+def window_start(today: date = None) -> date:
+    return (today or datetime.utcnow().date()) - timedelta(days=EVENT_WINDOW_DAYS)
+
+
+def _event_leaves():
+    # Every events leaf is an average, so sum + count per bucket recombines exactly
+    return [leaf_id for leaf_id, spec in LEAF_SCORERS.items() if spec.source == "events"]
+
+
+def _upsert(db: Session, rows):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(EventLeafAggregate)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["leaf_id", "supplier_id", "bucket_date"],
+        set_={
+            "value_sum": EventLeafAggregate.value_sum + stmt.excluded.value_sum,
+            "value_count": EventLeafAggregate.value_count + stmt.excluded.value_count,
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def accumulate_events(db: Session, event_ids: Sequence[str] = None, today: date = None) -> int:
+    """
+    Add events (all of them when ``event_ids`` is None) to their day
+    buckets: one GROUP BY (day, supplier) with a sum and count column per
+    leaf, then one multi-row upsert. Does not commit. Returns buckets touched.
+    """
+    leaf_ids = _event_leaves()
+    columns = []
+    for leaf_id in leaf_ids:
+        spec = LEAF_SCORERS[leaf_id]
+        condition = spec.row_condition
+        value = spec.expression if condition is None else case((condition, spec.expression))
+        columns += [func.sum(value), func.count(value)]
+
+    supplier = func.coalesce(SupplyChainEvent.supplier_id, "")
+    q = db.query(EVENT_DAY, supplier, *columns).filter(EVENT_DAY >= window_start(today))
+    if event_ids is not None:
+        if not event_ids:
+            return 0
+        q = q.filter(SupplyChainEvent.event_id.in_(event_ids))
+
+    rows = []
+    for day, supplier_id, *sums in q.group_by(EVENT_DAY, supplier).all():
+        for j, leaf_id in enumerate(leaf_ids):
+            total, count = sums[2 * j], sums[2 * j + 1]
+            if count:
+                rows.append({
+                    "leaf_id": leaf_id, "supplier_id": supplier_id, "bucket_date": day,
+                    "value_sum": float(total), "value_count": int(count),
+                })
+    if rows:
+        _upsert(db, rows)
+    return len(rows)
+
+
+def rebuild_event_aggregates(db: Session, today: date = None) -> int:
+    """Recompute every bucket in the window from supply_chain_events. Commits."""
+    db.query(EventLeafAggregate).delete(synchronize_session=False)
+    touched = accumulate_events(db, None, today)
+    db.commit()
+    return touched
+
+
+def expire_event_aggregates(db: Session, today: date = None) -> int:
+    """Drop buckets that have slid out of the window. Commits."""
+    expired = db.query(EventLeafAggregate).filter(
+        EventLeafAggregate.bucket_date < window_start(today)).delete(synchronize_session=False)
+    db.commit()
+    return expired
+
+
+def _ensure_backfilled(db: Session) -> None:
+    global _backfill_checked
+    if _backfill_checked:
+        return
+    if db.query(EventLeafAggregate.leaf_id).first() is None and db.query(SupplyChainEvent.event_id).first():
+        rebuild_event_aggregates(db)
+    _backfill_checked = True
+
+
+def windowed_event_scores(db: Session, leaf_ids: Sequence[str], today: date = None) -> Dict[str, float]:
+    """Scores of events leaves over the window, from one grouped read of the day buckets."""
+    if not leaf_ids:
+        return {}
+    _ensure_backfilled(db)
+    rows = (
+        db.query(EventLeafAggregate.leaf_id, func.sum(EventLeafAggregate.value_sum),
+                 func.sum(EventLeafAggregate.value_count))
+        .filter(EventLeafAggregate.leaf_id.in_(leaf_ids), EventLeafAggregate.bucket_date >= window_start(today))
+        .group_by(EventLeafAggregate.leaf_id)
+        .all()
+    )
+    totals = {leaf_id: (total, count) for leaf_id, total, count in rows}
+    values = np.array([[
+        totals[leaf_id][0] / totals[leaf_id][1] if totals.get(leaf_id, (0, 0))[1] else np.nan
+        for leaf_id in leaf_ids
+    ]], dtype=np.float64)
+    return {
+        leaf_id: score
+        for leaf_id, score in zip(leaf_ids, score_values(leaf_ids, values)[0].tolist())
+        if score == score  # NaN: no events for this leaf in the window
+    }
@@ -0,0 +1,250 @@
+"""
+Evaluation Scheduler
+--------------------
+Evaluates the metric tree in the background so request handlers only read
+precomputed state.
+
+Every EVALUATION_INTERVAL_SECONDS, or sooner when trigger() is called after
+a data change (ingestion, tree reload), the scheduler scores the tree from
+live data, publishes the result into the shared tree state cache, runs it
+through the alert state machine and hands the resulting transitions to the
+registered publishers, followed by a tree delta listing only the nodes
+whose score or status changed since the previous evaluation. Evaluations are buffered and written
+as one bulk snapshot insert every SNAPSHOT_FLUSH_EVALUATIONS evaluations;
+snapshot compaction and rolling aggregate expiry run every
+COMPACTION_INTERVAL_SECONDS.
+
+Runs as an asyncio task on the app's event loop; DB work is done in worker
+threads. With several API worker processes every one runs the loop, but
+only the holder of the scheduler lease row evaluates: it renews the lease
+on every cycle, and another worker takes over once it has been expired for
+SCHEDULER_LEASE_SECONDS (e.g. the leader died).
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.db_models import SchedulerLease
+from services.alert_engine import alert_tracker, record_alert_transitions
+from services.leaf_scoring import live_leaf_scores
+from services.metric_tree import TreeResult, get_tree, propagate_scores
+from services.rolling_aggregates import expire_event_aggregates
+from services.snapshot_store import compact_snapshots, write_snapshots
+from services.tree_state import CachedTreeState, get_current_leaf_scores, tree_state_cache
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1").lower() not in ("0", "false", "no")
+EVALUATION_INTERVAL_SECONDS = float(os.getenv("EVALUATION_INTERVAL_SECONDS", "60"))
+SNAPSHOT_FLUSH_EVALUATIONS = int(os.getenv("SNAPSHOT_FLUSH_EVALUATIONS", "5"))
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("COMPACTION_INTERVAL_SECONDS", "3600"))
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", str(EVALUATION_INTERVAL_SECONDS * 3)))
+MIN_TRIGGER_SPACING_SECONDS = 1.0   # bursts of triggers collapse into one evaluation
+LEASE_NAME = "tree-scheduler"
+
+# Receives {"type": "alert" | "delta", "data": ...} messages
+Publisher = Callable[[dict], Awaitable[None]]
+
+
+def acquire_lease(db: Session, name: str, holder: str, ttl: float) -> bool:
+    """Take or renew lease ``name`` for ``holder`` unless someone else holds it unexpired. Commits."""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    renewed = (
+        db.query(SchedulerLease)
+        .filter(SchedulerLease.name == name, or_(SchedulerLease.holder == holder, SchedulerLease.expires_at < now))
+        .update({"holder": holder, "expires_at": expires_at}, synchronize_session=False)
+    )
+    if not renewed:
+        try:
+            db.add(SchedulerLease(name=name, holder=holder, expires_at=expires_at))
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            return False
+    db.commit()
+    return True
+
+
+def release_lease(db: Session, name: str, holder: str) -> None:
+    db.query(SchedulerLease).filter(SchedulerLease.name == name, SchedulerLease.holder == holder).delete(
+        synchronize_session=False)
+    db.commit()
+
+
+class TreeScheduler:
+    def __init__(self, interval: float = EVALUATION_INTERVAL_SECONDS, lease_seconds: float = SCHEDULER_LEASE_SECONDS):
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.holder = str(uuid.uuid4())
+        self.leader = False
+        self._publishers: List[Publisher] = []
+        self._pending: List[Tuple[datetime, TreeResult]] = []
+        self._previous: Optional[TreeResult] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_compaction = time.monotonic()
+
+    def add_publisher(self, publisher: Publisher) -> None:
+        if publisher not in self._publishers:
+            self._publishers.append(publisher)
+
+    # ── Lifecycle ──────────────────────────────────────────────────────────────
+    def start(self) -> None:
+        """Start the evaluation loop on the running event loop."""
+        if not SCHEDULER_ENABLED or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._wake.set()  # evaluate right away rather than one interval after startup
+        self._task = self._loop.create_task(self._run(), name="tree-scheduler")
+
+    async def stop(self) -> None:
+        """Cancel the loop and write out any buffered snapshots."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._flush)
+        if self.leader:
+            await asyncio.to_thread(self._release)
+
+    def trigger(self) -> None:
+        """Request an evaluation soon; safe to call from any thread."""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                if await asyncio.to_thread(self._hold_lease):
+                    await self.run_once()
+            except Exception:
+                logger.exception("scheduled tree evaluation failed")
+            await asyncio.sleep(MIN_TRIGGER_SPACING_SECONDS)
+
+    # ── Leadership ─────────────────────────────────────────────────────────────
+    def _hold_lease(self) -> bool:
+        with SessionLocal() as db:
+            leader = acquire_lease(db, LEASE_NAME, self.holder, self.lease_seconds)
+        if leader != self.leader:
+            logger.info("tree scheduler %s leadership", "took" if leader else "lost")
+            if leader:
+                # Another worker ran the alert state machine meanwhile; resume from the DB
+                alert_tracker.reset()
+                self._previous = None
+            else:
+                self._flush()
+            self.leader = leader
+        return leader
+
+    def _release(self) -> None:
+        with SessionLocal() as db:
+            release_lease(db, LEASE_NAME, self.holder)
+        self.leader = False
+
+    # ── One cycle ──────────────────────────────────────────────────────────────
+    async def run_once(self) -> CachedTreeState:
+        state = await asyncio.to_thread(self._evaluate)
+        self._pending.append((datetime.utcnow(), state.result))
+        if len(self._pending) >= SNAPSHOT_FLUSH_EVALUATIONS:
+            await asyncio.to_thread(self._flush)
+        if time.monotonic() - self._last_compaction >= COMPACTION_INTERVAL_SECONDS:
+            await asyncio.to_thread(self._compact)
+        transitions = await asyncio.to_thread(self._track_alerts, state.result)
+        for kind, alert in transitions:
+            alert["alert_event"] = kind
+            await self._publish({"type": "alert", "data": alert})
+        delta = self._delta(state.result)
+        if delta is not None:
+            await self._publish({"type": "delta", "data": delta})
+        return state
+
+    def _evaluate(self) -> CachedTreeState:
+        tree = get_tree()
+        data_version = tree_state_cache.data_version
+        with SessionLocal() as db:
+            # Leaves without a live scorer keep their last known score
+            current = tree_state_cache.peek()
+            if current is not None and current.tree is tree:
+                base = current.leaf_scores
+            else:
+                base = get_current_leaf_scores(db, tree)
+            leaf_scores = {**base, **live_leaf_scores(db, tree)}
+        result = propagate_scores(leaf_scores, tree)
+        # Stay fresh until well past the next scheduled evaluation
+        max_age = max(self.interval * 2, tree_state_cache.max_age)
+        return tree_state_cache.publish(tree, data_version, leaf_scores, result, max_age)
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with SessionLocal() as db:
+            write_snapshots(db, pending)
+            db.commit()
+
+    def _compact(self) -> None:
+        self._last_compaction = time.monotonic()
+        # Rollups advance their watermark past what is stored, so buffered evaluations go in first
+        self._flush()
+        with SessionLocal() as db:
+            stats = compact_snapshots(db, get_tree())
+            stats["event_buckets_expired"] = expire_event_aggregates(db)
+        logger.info("snapshot compaction: %s", stats)
+
+    def _track_alerts(self, result: TreeResult) -> List[Tuple[str, dict]]:
+        with SessionLocal() as db:
+            alert_tracker.load_open(db)
+            transitions = alert_tracker.observe(result)
+            record_alert_transitions(db, transitions)
+        return transitions
+
+    def _delta(self, result: TreeResult) -> Optional[dict]:
+        """
+        Changes since the previous evaluation, or None if nothing moved. After
+        a tree swap node indices no longer line up, so a reset is sent instead
+        and clients reload the snapshot.
+        """
+        previous, self._previous = self._previous, result
+        if previous is not None and previous.tree is result.tree:
+            changed = result.changed_indices(previous)
+            if not changed:
+                return None
+            body = {"nodes": result.delta(changed)}
+        else:
+            body = {"reset": True}
+        return {
+            "tree_version": result.tree.version,
+            "evaluated_at": datetime.utcnow().isoformat(),
+            **body,
+        }
+
+    async def _publish(self, message: dict) -> None:
+        for publisher in self._publishers:
+            try:
+                await publisher(message)
+            except Exception:
+                logger.exception("%s publisher failed", message["type"])
+
+
+scheduler = TreeScheduler()
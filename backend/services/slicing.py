@@ -0,0 +1,118 @@
+"""
+Slice Scoring
+-------------
+Scores one metric tree per OEM, Tier-1 supplier and chip SKU in a single
+batched evaluation. Leaves whose source can be grouped by the dimension
+(events, inventory) are re-scored per slice through the leaf scorers, one
+GROUP BY query per source and dimension; every other leaf keeps its
+current global score. All slice rows are then scored together through
+propagate_scores_batch.
+"""
+import numpy as np
+from typing import Any, Dict, List, Sequence
+from sqlalchemy.orm import Session
+from models.db_models import Supplier
+from services.leaf_scoring import SOURCES, aggregate_source, score_values, scored_leaves
+from services.metric_tree import CompiledTree, STATUS_LABELS, get_tree, propagate_scores_batch
+
+# dimension → sources that can be grouped by it
+SLICE_DIMENSIONS = {
+    dimension: [source for source, (_, _, columns) in SOURCES.items() if dimension in columns]
+    for dimension in ("oem", "supplier", "sku")
+}
+
+
+def aggregate_slice_scores(db: Session, dimension: str, tree: CompiledTree):
+    """
+    Leaf scores per slice key for one dimension: one GROUP BY query per
+    source that supports it, merged by key. Returns (keys, event_counts,
+    leaf_ids, scores) where scores is (slices × leaf_ids), NaN where the
+    slice had no data for a leaf.
+    """
+    keys: List[Any] = []
+    row_of: Dict[Any, int] = {}
+    event_counts: Dict[Any, int] = {}
+    parts = []
+    for source in SLICE_DIMENSIONS[dimension]:
+        leaf_ids = scored_leaves(source, tree)
+        if not leaf_ids:
+            continue
+        source_keys, counts, values = aggregate_source(db, source, leaf_ids, dimension)
+        for key, count in zip(source_keys, counts):
+            if key not in row_of:
+                row_of[key] = len(keys)
+                keys.append(key)
+            if source == "events":
+                event_counts[key] = count
+        parts.append((leaf_ids, [row_of[k] for k in source_keys], score_values(leaf_ids, values)))
+
+    all_leaf_ids = [leaf_id for leaf_ids, _, _ in parts for leaf_id in leaf_ids]
+    scores = np.full((len(keys), len(all_leaf_ids)), np.nan)
+    col = 0
+    for leaf_ids, rows, block in parts:
+        scores[rows, col:col + len(leaf_ids)] = block
+        col += len(leaf_ids)
+    return keys, [event_counts.get(k, 0) for k in keys], all_leaf_ids, scores
+
+
+def score_slices(
+    db: Session,
+    base_leaf_scores: Dict[str, float],
+    dimensions: Sequence[str] = tuple(SLICE_DIMENSIONS),
+    node_id: str = "root",
+    tree: CompiledTree = None,
+) -> List[Dict[str, Any]]:
+    """
+    Score every slice of the requested dimensions in one batch and return
+    them ranked worst-first by ``node_id``'s score.
+    """
+    tree = tree or get_tree()
+    base = tree.leaf_matrix([base_leaf_scores])[0]
+    column = {leaf_id: j for j, leaf_id in enumerate(tree.leaf_ids)}
+
+    blocks, masks, meta = [], [], []
+    for dimension in dimensions:
+        keys, counts, leaf_ids, leaf_scores = aggregate_slice_scores(db, dimension, tree)
+        if not keys:
+            continue
+        block = np.repeat(base[np.newaxis, :], len(keys), axis=0)
+        mask = np.zeros(block.shape, dtype=bool)
+        for s, leaf_id in enumerate(leaf_ids):
+            has_data = ~np.isnan(leaf_scores[:, s])
+            block[has_data, column[leaf_id]] = leaf_scores[has_data, s]
+            mask[has_data, column[leaf_id]] = True
+        blocks.append(block)
+        masks.append(mask)
+        meta.extend((dimension, key, count) for key, count in zip(keys, counts))
+
+    if not blocks:
+        return []
+
+    leaves = np.vstack(blocks)
+    scores, codes = propagate_scores_batch(leaves, tree)
+    target = tree.index[node_id]
+    root = tree.index["root"]
+    # Worst leaf among the ones re-aggregated for the slice, i.e. what sets it apart
+    sliced = np.where(np.vstack(masks), leaves, np.inf)
+    worst_leaf = sliced.argmin(axis=1)
+    order = np.argsort(scores[:, target], kind="stable")
+
+    supplier_names = dict(db.query(Supplier.supplier_id, Supplier.name).all()) if "supplier" in dimensions else {}
+    ranked = []
+    for r in order.tolist():
+        dimension, key, count = meta[r]
+        w = int(worst_leaf[r])
+        has_worst = bool(np.isfinite(sliced[r, w]))
+        ranked.append({
+            "dimension": dimension,
+            "key": key,
+            "label": supplier_names.get(key, key) if dimension == "supplier" else key,
+            "event_count": count,
+            "node_id": node_id,
+            "score": round(float(scores[r, target]), 2),
+            "status": STATUS_LABELS[codes[r, target]],
+            "root_score": round(float(scores[r, root]), 2),
+            "worst_leaf": tree.leaf_ids[w] if has_worst else None,
+            "worst_leaf_score": round(float(sliced[r, w]), 2) if has_worst else None,
+        })
+    return ranked
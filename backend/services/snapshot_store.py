@@ -0,0 +1,541 @@
+"""
+Snapshot Store
+--------------
+Persists and reads metric tree evaluations.
+
+Two layouts are supported, selected by SNAPSHOT_STORAGE:
+    wide  one metric_snapshot_frames row per evaluation holding every node
+          score as a packed float32 vector, keyed by tree version (default)
+    rows  one metric_snapshots row per node per evaluation (legacy)
+
+Readers check frames first and fall back to legacy rows, so history
+written before switching modes stays visible.
+
+compact_snapshots rolls raw evaluations into hourly and daily
+min/mean/max/last buckets (metric_snapshot_rollups) and prunes each tier
+past its retention; node_series reads a range from the coarsest tier that
+still resolves it.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.db_models import MetricSnapshot, MetricSnapshotFrame, MetricSnapshotRollup, MetricTreeVersion, gen_uuid
+from services.metric_tree import DEFAULT_SCORE, CompiledTree, TreeResult, compute_status
+from services.tree_registry import registry
+
+SNAPSHOT_STORAGE = os.getenv("SNAPSHOT_STORAGE", "wide")
+
+# tree_hash → node_ids; versions are immutable so this never needs invalidating
+_version_columns: Dict[str, List[str]] = {}
+
+
+def pack_scores(scores: np.ndarray) -> bytes:
+    return np.asarray(scores, dtype="<f4").tobytes()
+
+
+def unpack_scores(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f4")
+
+
+# ── Tree versions ──────────────────────────────────────────────────────────────
+def ensure_tree_version(db: Session, tree: CompiledTree) -> None:
+    """Record the node order of a tree version once, so its frames can be decoded later."""
+    if tree.version in _version_columns:
+        return
+    if db.get(MetricTreeVersion, tree.version) is None:
+        try:
+            with db.begin_nested():
+                db.add(MetricTreeVersion(
+                    tree_hash=tree.version,
+                    node_ids=json.dumps(tree.node_ids),
+                    definition=json.dumps(tree.definition),
+                ))
+        except IntegrityError:
+            pass  # recorded concurrently by another process
+    _version_columns[tree.version] = list(tree.node_ids)
+
+
+def version_columns(db: Session, tree_hash: str) -> Dict[str, int]:
+    """node_id → column index in frames written by ``tree_hash``."""
+    node_ids = _version_columns.get(tree_hash)
+    if node_ids is None:
+        record = db.get(MetricTreeVersion, tree_hash)
+        node_ids = json.loads(record.node_ids) if record else []
+        _version_columns[tree_hash] = node_ids
+    return {node_id: j for j, node_id in enumerate(node_ids)}
+
+
+# ── Writes ─────────────────────────────────────────────────────────────────────
+def write_frames(db: Session, evaluations: Sequence[Tuple[datetime, TreeResult]]) -> int:
+    """Bulk-insert evaluations, one wide row each. Does not commit."""
+    if not evaluations:
+        return 0
+    for tree in {id(r.tree): r.tree for _, r in evaluations}.values():
+        ensure_tree_version(db, tree)
+    db.execute(insert(MetricSnapshotFrame), [
+        {"tree_hash": result.tree.version, "evaluated_at": evaluated_at, "scores": pack_scores(result.scores)}
+        for evaluated_at, result in evaluations
+    ])
+    return len(evaluations)
+
+
+def write_rows(db: Session, evaluations: Sequence[Tuple[datetime, TreeResult]]) -> int:
+    """Legacy layout: one metric_snapshots row per node, inserted in one executemany. Does not commit."""
+    rows = []
+    for evaluated_at, result in evaluations:
+        tree = result.tree
+        for i, node_id in enumerate(tree.node_ids):
+            node = result.node(i)
+            rows.append({
+                "snapshot_id": gen_uuid(),
+                "node_id": node_id,
+                "node_level": int(tree.depth[i]),
+                "node_label": node["label"],
+                "score": node["score"],
+                "status": node["status"],
+                "flagged": node["flagged"],
+                "parent_node_id": node["parent"],
+                "evaluated_at": evaluated_at,
+            })
+    if rows:
+        db.execute(insert(MetricSnapshot), rows)
+    return len(evaluations)
+
+
+def write_snapshots(db: Session, evaluations: Sequence[Tuple[datetime, TreeResult]]) -> int:
+    writer = write_rows if SNAPSHOT_STORAGE == "rows" else write_frames
+    return writer(db, evaluations)
+
+
+# ── Reads ──────────────────────────────────────────────────────────────────────
+def _frame_leaf_scores(db: Session, tree: CompiledTree, frame: MetricSnapshotFrame) -> Dict[str, float]:
+    columns = version_columns(db, frame.tree_hash)
+    values = unpack_scores(frame.scores)
+    return {
+        leaf_id: round(float(values[columns[leaf_id]]), 2)
+        for leaf_id in tree.leaf_ids if leaf_id in columns
+    }
+
+
+def latest_leaf_scores(db: Session, tree: CompiledTree) -> Dict[str, float]:
+    """Most recent persisted score for every leaf of ``tree`` (empty if nothing is stored)."""
+    frame = db.query(MetricSnapshotFrame).order_by(MetricSnapshotFrame.evaluated_at.desc()).first()
+    if frame is not None:
+        return _frame_leaf_scores(db, tree, frame)
+
+    # Legacy rows: latest row per leaf in one grouped query (node_id, evaluated_at index)
+    newest = (
+        db.query(MetricSnapshot.node_id, func.max(MetricSnapshot.evaluated_at).label("evaluated_at"))
+        .filter(MetricSnapshot.node_id.in_(tree.leaf_ids))
+        .group_by(MetricSnapshot.node_id)
+        .subquery()
+    )
+    rows = (
+        db.query(MetricSnapshot.node_id, MetricSnapshot.score)
+        .join(newest, and_(
+            MetricSnapshot.node_id == newest.c.node_id,
+            MetricSnapshot.evaluated_at == newest.c.evaluated_at,
+        ))
+        .all()
+    )
+    return {node_id: score for node_id, score in rows}
+
+
+def node_history(db: Session, node_id: str, limit: int = 30) -> List[Dict]:
+    """Newest-first score history of one node, decoded from frames (or legacy rows)."""
+    frames = (
+        db.query(MetricSnapshotFrame.tree_hash, MetricSnapshotFrame.evaluated_at, MetricSnapshotFrame.scores)
+        .order_by(MetricSnapshotFrame.evaluated_at.desc())
+        .limit(limit)
+        .all()
+    )
+    history = []
+    for tree_hash, evaluated_at, blob in frames:
+        j = version_columns(db, tree_hash).get(node_id)
+        if j is None:
+            continue
+        score = round(float(unpack_scores(blob)[j]), 2)
+        history.append({"score": score, "status": compute_status(score), "evaluated_at": evaluated_at.isoformat()})
+    if history:
+        return history
+
+    rows = (
+        db.query(MetricSnapshot)
+        .filter(MetricSnapshot.node_id == node_id)
+        .order_by(MetricSnapshot.evaluated_at.desc())
+        .limit(limit)
+        .all()
+    )
+    return [{"score": h.score, "status": h.status, "evaluated_at": h.evaluated_at.isoformat()} for h in rows]
+
+
+# ── Rollups & retention ────────────────────────────────────────────────────────
+RAW_RETENTION_DAYS = float(os.getenv("SNAPSHOT_RAW_RETENTION_DAYS", "7"))
+HOURLY_RETENTION_DAYS = float(os.getenv("SNAPSHOT_HOURLY_RETENTION_DAYS", "90"))
+DAILY_RETENTION_DAYS = float(os.getenv("SNAPSHOT_DAILY_RETENTION_DAYS", "0"))  # 0 = keep forever
+HISTORY_TARGET_POINTS = 500
+
+# Tiers from finest to coarsest: name → bucket width
+TIERS = {"raw": timedelta(0), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+def _floor(dt: datetime, tier: str) -> datetime:
+    if tier == "day":
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+class _Bucket:
+    """Running min/mean/max/last of score vectors for one (tier, bucket, tree version); NaN = no sample."""
+
+    def __init__(self, tier: str, start: datetime, tree_hash: str):
+        self.tier, self.start, self.tree_hash = tier, start, tree_hash
+        self.count = 0
+        self.min = self.max = self.total = self.weight = self.last = None
+
+    def add(self, count: int, vmin: np.ndarray, mean: np.ndarray, vmax: np.ndarray, last: np.ndarray) -> None:
+        present = ~np.isnan(mean)
+        if self.count == 0:
+            self.min, self.max, self.last = vmin.copy(), vmax.copy(), last.copy()
+            self.total = np.where(present, mean * count, 0.0)
+            self.weight = np.where(present, float(count), 0.0)
+        else:
+            self.min, self.max = np.fmin(self.min, vmin), np.fmax(self.max, vmax)
+            self.last = np.where(np.isnan(last), self.last, last)
+            self.total += np.where(present, mean * count, 0.0)
+            self.weight += np.where(present, float(count), 0.0)
+        self.count += count
+
+    def add_sample(self, vector: np.ndarray) -> None:
+        self.add(1, vector, vector, vector, vector)
+
+    def row(self) -> Dict:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(self.weight > 0, self.total / self.weight, np.nan)
+        return {
+            "tier": self.tier,
+            "bucket_start": self.start,
+            "tree_hash": self.tree_hash,
+            "sample_count": self.count,
+            "min_scores": pack_scores(self.min),
+            "mean_scores": pack_scores(mean),
+            "max_scores": pack_scores(self.max),
+            "last_scores": pack_scores(self.last),
+        }
+
+
+def _raw_vectors(db: Session, start: Optional[datetime], end: datetime, tree: CompiledTree):
+    """
+    Yield (evaluated_at, tree_hash, float vector) for raw evaluations in
+    [start, end), oldest first: frames, then legacy rows regrouped into
+    vectors of the current tree.
+    """
+    q = db.query(MetricSnapshotFrame.evaluated_at, MetricSnapshotFrame.tree_hash, MetricSnapshotFrame.scores)
+    q = q.filter(MetricSnapshotFrame.evaluated_at < end)
+    if start is not None:
+        q = q.filter(MetricSnapshotFrame.evaluated_at >= start)
+    for evaluated_at, tree_hash, blob in q.order_by(MetricSnapshotFrame.evaluated_at).yield_per(1000):
+        yield evaluated_at, tree_hash, unpack_scores(blob).astype(np.float64)
+
+    q = db.query(MetricSnapshot.evaluated_at, MetricSnapshot.node_id, MetricSnapshot.score)
+    q = q.filter(MetricSnapshot.evaluated_at < end)
+    if start is not None:
+        q = q.filter(MetricSnapshot.evaluated_at >= start)
+    current, vector = None, None
+    for evaluated_at, node_id, score in q.order_by(MetricSnapshot.evaluated_at).yield_per(5000):
+        if evaluated_at != current:
+            if vector is not None:
+                yield current, tree.version, vector
+            current, vector = evaluated_at, np.full(len(tree), np.nan)
+        i = tree.index.get(node_id)
+        if i is not None and score is not None:
+            vector[i] = score
+    if vector is not None:
+        yield current, tree.version, vector
+
+
+def _flush(db: Session, buckets: Dict) -> int:
+    if buckets:
+        db.execute(insert(MetricSnapshotRollup), [b.row() for b in buckets.values()])
+    n = len(buckets)
+    buckets.clear()
+    return n
+
+
+def _rollup_raw(db: Session, until: datetime, tree: CompiledTree) -> int:
+    """Roll every complete hour of raw evaluations after the hourly watermark into hourly buckets."""
+    last = db.query(func.max(MetricSnapshotRollup.bucket_start)).filter(MetricSnapshotRollup.tier == "hour").scalar()
+    start = last + TIERS["hour"] if last else None
+    # Legacy rows are regrouped against the current tree, whose version must be recorded
+    ensure_tree_version(db, tree)
+
+    buckets: Dict[Tuple[datetime, str], _Bucket] = {}
+    written, current_hour = 0, None
+    for evaluated_at, tree_hash, vector in sorted(_raw_vectors(db, start, until, tree), key=lambda x: x[0]):
+        hour = _floor(evaluated_at, "hour")
+        if hour != current_hour:
+            written += _flush(db, buckets)
+            current_hour = hour
+        key = (hour, tree_hash)
+        if key not in buckets:
+            buckets[key] = _Bucket("hour", hour, tree_hash)
+        buckets[key].add_sample(vector)
+    return written + _flush(db, buckets)
+
+
+def _rollup_hourly(db: Session, until: datetime) -> int:
+    """Roll complete days of hourly buckets after the daily watermark into daily buckets."""
+    last = db.query(func.max(MetricSnapshotRollup.bucket_start)).filter(MetricSnapshotRollup.tier == "day").scalar()
+    q = db.query(MetricSnapshotRollup).filter(
+        MetricSnapshotRollup.tier == "hour", MetricSnapshotRollup.bucket_start < until,
+    )
+    if last:
+        q = q.filter(MetricSnapshotRollup.bucket_start >= last + TIERS["day"])
+
+    buckets: Dict[Tuple[datetime, str], _Bucket] = {}
+    written, current_day = 0, None
+    for r in q.order_by(MetricSnapshotRollup.bucket_start).yield_per(500):
+        day = _floor(r.bucket_start, "day")
+        if day != current_day:
+            written += _flush(db, buckets)
+            current_day = day
+        key = (day, r.tree_hash)
+        if key not in buckets:
+            buckets[key] = _Bucket("day", day, r.tree_hash)
+        buckets[key].add(
+            r.sample_count,
+            unpack_scores(r.min_scores).astype(np.float64),
+            unpack_scores(r.mean_scores).astype(np.float64),
+            unpack_scores(r.max_scores).astype(np.float64),
+            unpack_scores(r.last_scores).astype(np.float64),
+        )
+    return written + _flush(db, buckets)
+
+
+def compact_snapshots(db: Session, tree: CompiledTree, now: datetime = None) -> Dict[str, int]:
+    """
+    Roll raw evaluations into hourly and daily min/mean/max/last buckets,
+    then prune each tier past its retention window. Only complete hours and
+    days are rolled up; each bucket is written once (watermarked by the
+    newest bucket already in its tier). Commits.
+    """
+    now = now or datetime.utcnow()
+    stats = {
+        "hourly_buckets": _rollup_raw(db, _floor(now, "hour"), tree),
+        "daily_buckets": _rollup_hourly(db, _floor(now, "day")),
+    }
+
+    raw_cutoff = now - timedelta(days=RAW_RETENTION_DAYS)
+    hourly_watermark = db.query(func.max(MetricSnapshotRollup.bucket_start)).filter(
+        MetricSnapshotRollup.tier == "hour").scalar()
+    if hourly_watermark is not None:
+        # never prune raw data that has not been rolled up yet
+        raw_cutoff = min(raw_cutoff, hourly_watermark + TIERS["hour"])
+        stats["raw_frames_pruned"] = db.query(MetricSnapshotFrame).filter(
+            MetricSnapshotFrame.evaluated_at < raw_cutoff).delete(synchronize_session=False)
+        stats["raw_rows_pruned"] = db.query(MetricSnapshot).filter(
+            MetricSnapshot.evaluated_at < raw_cutoff).delete(synchronize_session=False)
+
+    daily_watermark = db.query(func.max(MetricSnapshotRollup.bucket_start)).filter(
+        MetricSnapshotRollup.tier == "day").scalar()
+    if daily_watermark is not None:
+        hourly_cutoff = min(now - timedelta(days=HOURLY_RETENTION_DAYS), daily_watermark + TIERS["day"])
+        stats["hourly_pruned"] = db.query(MetricSnapshotRollup).filter(
+            MetricSnapshotRollup.tier == "hour", MetricSnapshotRollup.bucket_start < hourly_cutoff,
+        ).delete(synchronize_session=False)
+    if DAILY_RETENTION_DAYS > 0:
+        stats["daily_pruned"] = db.query(MetricSnapshotRollup).filter(
+            MetricSnapshotRollup.tier == "day",
+            MetricSnapshotRollup.bucket_start < now - timedelta(days=DAILY_RETENTION_DAYS),
+        ).delete(synchronize_session=False)
+    db.commit()
+    return stats
+
+
+# ── Range reads ────────────────────────────────────────────────────────────────
+def _tier_oldest(db: Session, tier: str) -> Optional[datetime]:
+    if tier == "raw":
+        oldest = [
+            db.query(func.min(MetricSnapshotFrame.evaluated_at)).scalar(),
+            db.query(func.min(MetricSnapshot.evaluated_at)).scalar(),
+        ]
+        oldest = [t for t in oldest if t is not None]
+        return min(oldest) if oldest else None
+    return db.query(func.min(MetricSnapshotRollup.bucket_start)).filter(MetricSnapshotRollup.tier == tier).scalar()
+
+
+def choose_tier(db: Session, start: datetime, end: datetime, max_points: int = HISTORY_TARGET_POINTS) -> str:
+    """
+    Coarsest tier whose bucket width still gives at least ``max_points``
+    over the range, provided it holds data back to ``start``; otherwise the
+    finest tier that does reach back that far.
+    """
+    resolution = (end - start) / max(max_points, 1)
+    names = list(TIERS)
+    covering = [t for t in names if (_tier_oldest(db, t) or end) <= start]
+    if not covering:
+        return names[-1] if _tier_oldest(db, names[-1]) else "raw"
+    fitting = [t for t in covering if TIERS[t] <= resolution]
+    return fitting[-1] if fitting else covering[0]
+
+
+def _raw_points(db: Session, node_id: str, start: datetime, end: datetime) -> List[Dict]:
+    points = []
+    frames = (
+        db.query(MetricSnapshotFrame.tree_hash, MetricSnapshotFrame.evaluated_at, MetricSnapshotFrame.scores)
+        .filter(MetricSnapshotFrame.evaluated_at >= start, MetricSnapshotFrame.evaluated_at < end)
+        .order_by(MetricSnapshotFrame.evaluated_at)
+        .yield_per(1000)
+    )
+    for tree_hash, evaluated_at, blob in frames:
+        j = version_columns(db, tree_hash).get(node_id)
+        if j is not None:
+            score = float(unpack_scores(blob)[j])
+            points.append({"t": evaluated_at, "score": score, "min": score, "max": score})
+    rows = (
+        db.query(MetricSnapshot.evaluated_at, MetricSnapshot.score)
+        .filter(MetricSnapshot.node_id == node_id,
+                MetricSnapshot.evaluated_at >= start, MetricSnapshot.evaluated_at < end)
+        .order_by(MetricSnapshot.evaluated_at)
+    )
+    points.extend({"t": t, "score": s, "min": s, "max": s} for t, s in rows)
+    points.sort(key=lambda p: p["t"])
+    return points
+
+
+def _rollup_points(db: Session, tier: str, node_id: str, start: datetime, end: datetime) -> List[Dict]:
+    rows = (
+        db.query(MetricSnapshotRollup.tree_hash, MetricSnapshotRollup.bucket_start,
+                 MetricSnapshotRollup.min_scores, MetricSnapshotRollup.mean_scores, MetricSnapshotRollup.max_scores)
+        .filter(MetricSnapshotRollup.tier == tier,
+                MetricSnapshotRollup.bucket_start >= _floor(start, tier), MetricSnapshotRollup.bucket_start < end)
+        .order_by(MetricSnapshotRollup.bucket_start)
+    )
+    points = []
+    for tree_hash, bucket_start, vmin, mean, vmax in rows:
+        j = version_columns(db, tree_hash).get(node_id)
+        if j is None:
+            continue
+        score = float(unpack_scores(mean)[j])
+        if score == score:  # skip buckets where the node had no samples (NaN)
+            points.append({"t": bucket_start, "score": score,
+                           "min": float(unpack_scores(vmin)[j]), "max": float(unpack_scores(vmax)[j])})
+    return points
+
+
+def downsample(points: List[Dict], max_points: int) -> List[Dict]:
+    """
+    Min/max bucketing: split the time span into ``max_points`` equal-width
+    buckets and keep one point per non-empty bucket with the mean score and
+    the extremes of everything in it, so spikes survive the reduction.
+    """
+    if len(points) <= max_points:
+        return points
+    first = points[0]["t"]
+    offsets = np.array([(p["t"] - first).total_seconds() for p in points])
+    span = offsets[-1] or 1.0
+    bucket = np.minimum((offsets / span * max_points).astype(np.int64), max_points - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(points)])
+
+    mean = np.add.reduceat(np.array([p["score"] for p in points]), starts) / counts
+    low = np.minimum.reduceat(np.array([p["min"] for p in points]), starts)
+    high = np.maximum.reduceat(np.array([p["max"] for p in points]), starts)
+    return [
+        {"t": points[i]["t"], "score": float(m), "min": float(lo), "max": float(hi)}
+        for i, m, lo, hi in zip(starts.tolist(), mean, low, high)
+    ]
+
+
+def node_series(db: Session, node_id: str, start: datetime, end: datetime,
+                max_points: int = HISTORY_TARGET_POINTS) -> Tuple[str, List[Dict]]:
+    """
+    Oldest-first points for one node over [start, end) from the coarsest
+    suitable tier, downsampled to at most ``max_points``. The tail newer
+    than the tier's last bucket is filled from finer tiers, so recent data
+    not yet rolled up is still included. Returns (tier, points).
+    """
+    tier = choose_tier(db, start, end, max_points)
+    names = list(TIERS)
+    points: List[Dict] = []
+    cursor = start
+    for name in reversed(names[:names.index(tier) + 1]):
+        if name == "raw":
+            chunk = _raw_points(db, node_id, cursor, end)
+        else:
+            chunk = _rollup_points(db, name, node_id, cursor, end)
+        if chunk:
+            points.extend(chunk)
+            cursor = max(cursor, chunk[-1]["t"] + (TIERS[name] or timedelta(microseconds=1)))
+    return tier, downsample(points, max_points)
+
+
+# ── Point-in-time reads ────────────────────────────────────────────────────────
+def tree_for_version(db: Session, tree_hash: str) -> Optional[CompiledTree]:
+    """Compiled tree for a recorded version, recompiled from its stored definition if needed."""
+    tree = registry.get(tree_hash)
+    if tree is None:
+        record = db.get(MetricTreeVersion, tree_hash)
+        if record is None or not record.definition:
+            return None
+        tree = registry.compile(json.loads(record.definition))
+    return tree
+
+
+def snapshot_as_of(db: Session, as_of: datetime, tree: CompiledTree) -> Optional[Tuple[str, datetime, TreeResult]]:
+    """
+    The evaluation in effect at ``as_of``: the newest raw evaluation at or
+    before it, decoded with the tree version it was scored under. Once raw
+    history has been compacted away, the last scores of the newest complete
+    hourly (then daily) bucket are used instead. ``tree`` is the tree legacy
+    rows are decoded with. Returns (resolution, evaluated_at, result) or
+    None when nothing was recorded that early. At most four indexed queries.
+    """
+    frame = (
+        db.query(MetricSnapshotFrame.tree_hash, MetricSnapshotFrame.evaluated_at, MetricSnapshotFrame.scores)
+        .filter(MetricSnapshotFrame.evaluated_at <= as_of)
+        .order_by(MetricSnapshotFrame.evaluated_at.desc())
+        .first()
+    )
+    # Every legacy evaluation includes the root row, which keeps this on the (node_id, evaluated_at) index
+    legacy_at = (
+        db.query(func.max(MetricSnapshot.evaluated_at))
+        .filter(MetricSnapshot.node_id == tree.node_ids[tree.root], MetricSnapshot.evaluated_at <= as_of)
+        .scalar()
+    )
+
+    if frame is not None and (legacy_at is None or frame.evaluated_at >= legacy_at):
+        version = tree_for_version(db, frame.tree_hash)
+        if version is not None:
+            return "raw", frame.evaluated_at, TreeResult(version, unpack_scores(frame.scores))
+
+    if legacy_at is not None:
+        rows = (
+            db.query(MetricSnapshot.node_id, MetricSnapshot.score)
+            .filter(MetricSnapshot.node_id.in_(tree.node_ids), MetricSnapshot.evaluated_at == legacy_at)
+            .all()
+        )
+        scores = np.full(len(tree), DEFAULT_SCORE)
+        for node_id, score in rows:
+            scores[tree.index[node_id]] = score
+        return "raw", legacy_at, TreeResult(tree, scores)
+
+    for tier in ("hour", "day"):
+        bucket = (
+            db.query(MetricSnapshotRollup.tree_hash, MetricSnapshotRollup.bucket_start, MetricSnapshotRollup.last_scores)
+            .filter(MetricSnapshotRollup.tier == tier, MetricSnapshotRollup.bucket_start <= as_of - TIERS[tier])
+            .order_by(MetricSnapshotRollup.bucket_start.desc())
+            .first()
+        )
+        version = tree_for_version(db, bucket.tree_hash) if bucket else None
+        if version is not None:
+            scores = unpack_scores(bucket.last_scores).astype(np.float64)
+            return tier, bucket.bucket_start, TreeResult(version, np.where(np.isnan(scores), DEFAULT_SCORE, scores))
+    return None
@@ -0,0 +1,236 @@
+"""
+Tree Registry
+-------------
+Loads metric tree definitions from JSON/YAML files or the
+metric_tree_definitions table, validates them, compiles each distinct
+definition once (cached by content hash) and swaps the active tree
+atomically when the source changes.
+
+Source selection (METRIC_TREE_SOURCE):
+    unset               built-in METRIC_TREE_DEFINITION (no reloading)
+    /path/to/tree.json  file (.json, .yaml, .yml)
+    db:<program>        newest metric_tree_definitions row for <program>
+"""
+import json
+import logging
+import math
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from services.metric_tree import NODE_FIELDS, CompiledTree, definition_hash, get_tree, set_tree
+
+logger = logging.getLogger(__name__)
+
+METRIC_TREE_SOURCE = os.getenv("METRIC_TREE_SOURCE", "")
+RELOAD_INTERVAL_SECONDS = float(os.getenv("METRIC_TREE_RELOAD_SECONDS", "5"))
+
+
+class TreeDefinitionError(ValueError):
+    """Raised when a tree definition cannot be loaded or fails validation."""
+
+
+# ── Loading ────────────────────────────────────────────────────────────────────
+def parse_definition(raw: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Accept either a node_id → meta mapping or the /tree-definition shape
+    ({"nodes": [{"node_id": ..., **meta}, ...]}) and normalize to the former.
+    """
+    if isinstance(raw, dict) and isinstance(raw.get("nodes"), list):
+        definition = {}
+        for node in raw["nodes"]:
+            if not isinstance(node, dict) or "node_id" not in node:
+                raise TreeDefinitionError("every entry in 'nodes' needs a node_id")
+            definition[node["node_id"]] = node
+        raw = definition
+    if not isinstance(raw, dict) or not raw:
+        raise TreeDefinitionError("tree definition must be a non-empty mapping of node_id → node")
+    for node_id, meta in raw.items():
+        if not isinstance(meta, dict):
+            raise TreeDefinitionError(f"{node_id}: node must be a mapping")
+        missing = [k for k in NODE_FIELDS if k not in meta]
+        if missing:
+            raise TreeDefinitionError(f"{node_id}: missing {', '.join(missing)}")
+    return {node_id: {k: meta[k] for k in NODE_FIELDS} for node_id, meta in raw.items()}
+
+
+def load_definition_file(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError as exc:
+            raise TreeDefinitionError("PyYAML is required to load YAML tree definitions") from exc
+        raw = yaml.safe_load(text)
+    else:
+        raw = json.loads(text)
+    return parse_definition(raw)
+
+
+def load_definition_db(program: str):
+    """Newest stored definition for an OEM program, or None."""
+    from database import SessionLocal
+    from models.db_models import MetricTreeDefinition
+
+    db = SessionLocal()
+    try:
+        return (
+            db.query(MetricTreeDefinition)
+            .filter(MetricTreeDefinition.program == program)
+            .order_by(MetricTreeDefinition.created_at.desc())
+            .first()
+        )
+    finally:
+        db.close()
+
+
+# ── Validation ─────────────────────────────────────────────────────────────────
+def validate_definition(definition: Dict[str, Dict[str, Any]]) -> None:
+    """Check weights, parent links, cycles and orphans; raise TreeDefinitionError on the first problem."""
+    roots = [n for n, meta in definition.items() if not meta["parent"]]
+    if roots != ["root"]:
+        raise TreeDefinitionError(f"expected a single root node named 'root', found {roots}")
+
+    children: Dict[str, list] = {n: [] for n in definition}
+    for node_id, meta in definition.items():
+        weight = meta["weight"]
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not math.isfinite(weight) or weight < 0:
+            raise TreeDefinitionError(f"{node_id}: weight must be a finite non-negative number")
+        if not isinstance(meta["leaf"], bool):
+            raise TreeDefinitionError(f"{node_id}: leaf must be true or false")
+        parent = meta["parent"]
+        if parent:
+            if parent not in definition:
+                raise TreeDefinitionError(f"{node_id}: parent {parent!r} is not defined")
+            if definition[parent]["leaf"]:
+                raise TreeDefinitionError(f"{node_id}: parent {parent!r} is a leaf")
+            children[parent].append(node_id)
+
+    for node_id, kids in children.items():
+        if not definition[node_id]["leaf"]:
+            if not kids:
+                raise TreeDefinitionError(f"{node_id}: internal node has no children")
+            if sum(definition[k]["weight"] for k in kids) <= 0:
+                raise TreeDefinitionError(f"{node_id}: children weights sum to zero")
+
+    # Everything must hang off the single root; anything else is a cycle or orphan
+    reachable, stack = set(), [roots[0]]
+    while stack:
+        node_id = stack.pop()
+        reachable.add(node_id)
+        stack.extend(children[node_id])
+    unreachable = [n for n in definition if n not in reachable]
+    if unreachable:
+        raise TreeDefinitionError(
+            f"{len(unreachable)} node(s) not reachable from {roots[0]!r} (cycle or orphan): {unreachable[:5]}"
+        )
+
+
+# ── Registry ───────────────────────────────────────────────────────────────────
+class TreeRegistry:
+    """
+    Compiled-tree cache plus the watcher that keeps the active tree in sync
+    with its source. Swapping is a single reference assignment, so requests
+    that already called get_tree() keep the version they started with.
+    """
+
+    def __init__(self, source: str = ""):
+        self.source = source
+        self._compiled: Dict[str, CompiledTree] = {}
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._listeners: List[Callable[[CompiledTree], None]] = []
+
+    def add_listener(self, listener: Callable[[CompiledTree], None]) -> None:
+        """Call ``listener(tree)`` after every swap made by refresh()."""
+        self._listeners.append(listener)
+
+    def compile(self, definition: Dict[str, Dict[str, Any]]) -> CompiledTree:
+        """Validate and compile, reusing the cached tree for identical content."""
+        key = definition_hash(definition)
+        tree = self._compiled.get(key)
+        if tree is None:
+            validate_definition(definition)
+            tree = CompiledTree(definition)
+            with self._lock:
+                tree = self._compiled.setdefault(key, tree)
+        return tree
+
+    def register(self, tree: CompiledTree) -> None:
+        with self._lock:
+            self._compiled.setdefault(tree.version, tree)
+
+    def get(self, version: str) -> Optional[CompiledTree]:
+        return self._compiled.get(version)
+
+    def activate(self, definition: Dict[str, Dict[str, Any]]) -> CompiledTree:
+        tree = self.compile(definition)
+        set_tree(tree)
+        return tree
+
+    def _source_stamp(self):
+        if self.source.startswith("db:"):
+            record = load_definition_db(self.source[3:])
+            return (record.tree_hash, record) if record else (None, None)
+        stat = os.stat(self.source)
+        return (stat.st_mtime_ns, stat.st_size), None
+
+    def refresh(self) -> bool:
+        """Reload from the source if it changed since the last check. Returns True on swap."""
+        if not self.source:
+            return False
+        stamp, record = self._source_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        # Remember the stamp up front so a broken source is reported once, not every poll
+        self._stamp = stamp
+        if record is not None:
+            definition = parse_definition(json.loads(record.definition))
+        else:
+            definition = load_definition_file(self.source)
+        tree = self.activate(definition)
+        logger.info("metric tree %s activated from %s", tree.version[:12], self.source)
+        for listener in self._listeners:
+            listener(tree)
+        return True
+
+    def start_watcher(self, interval: float = RELOAD_INTERVAL_SECONDS) -> None:
+        """Poll the source on a daemon thread so no request ever compiles."""
+        if not self.source or self._watcher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("metric tree reload from %s failed; keeping current tree", self.source)
+
+        self._watcher = threading.Thread(target=run, name="metric-tree-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+
+
+registry = TreeRegistry(METRIC_TREE_SOURCE)
+registry.register(get_tree())
+
+
+def save_definition_db(db, program: str, definition: Dict[str, Dict[str, Any]]):
+    """Store a validated definition for an OEM program; watchers pick it up on their next poll."""
+    from models.db_models import MetricTreeDefinition
+
+    definition = parse_definition(definition)
+    validate_definition(definition)
+    record = MetricTreeDefinition(
+        program=program,
+        tree_hash=definition_hash(definition),
+        definition=json.dumps(definition),
+    )
+    db.add(record)
+    db.commit()
+    return record
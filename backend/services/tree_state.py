@@ -0,0 +1,178 @@
+"""
+Tree State Cache
+----------------
+Process-wide cache of the current scored tree. Every read endpoint shares
+one leaf fetch + propagation per snapshot version instead of recomputing
+it per request.
+
+The cache is invalidated by writers (persist_metric_snapshot, ingestion)
+via invalidate_tree_state(), and also expires after
+TREE_STATE_MAX_AGE_SECONDS so writes made by other processes are picked
+up. Concurrent callers on a stale cache wait for the single in-flight
+computation instead of each querying the DB.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from services.leaf_scoring import live_leaf_scores
+from services.metric_tree import CompiledTree, TreeResult, get_all_alerts, get_tree, propagate_scores
+from services.snapshot_store import latest_leaf_scores
+
+MAX_AGE_SECONDS = float(os.getenv("TREE_STATE_MAX_AGE_SECONDS", "30"))
+
+
+def get_current_leaf_scores(db: Session, tree: CompiledTree = None) -> Dict[str, float]:
+    """
+    Pull the most recent snapshot scores for leaf nodes; without snapshots,
+    derive them from live data, and simulate if there is none either.
+    """
+    tree = tree or get_tree()
+    latest = latest_leaf_scores(db, tree) or live_leaf_scores(db, tree)
+
+    # If no snapshots or source data yet, simulate
+    if not latest:
+        rng = random.Random(99)
+        for node_id in tree.leaf_ids:
+            base = rng.uniform(45, 95)
+            # Inject realistic low scores for demo
+            if "fab_concentration" in node_id or "taiwan" in node_id:
+                base = rng.uniform(20, 45)
+            elif "material" in node_id:
+                base = rng.uniform(30, 55)
+            latest[node_id] = base
+    return latest
+
+
+def content_version(tree: CompiledTree, result: TreeResult) -> str:
+    """
+    Identifies what an evaluation serves: the tree and its scores at API
+    precision. Equal across recomputations and workers for equal content,
+    so it can back an ETag.
+    """
+    digest = hashlib.blake2b(tree.version.encode(), digest_size=12)
+    digest.update(np.round(result.scores, 2).tobytes())
+    digest.update(np.ascontiguousarray(result.codes, dtype=np.uint8).tobytes())
+    return f"{tree.version[:16]}-{digest.hexdigest()}"
+
+
+class CachedTreeState:
+    """One evaluation of the current tree, shared read-only across requests."""
+
+    def __init__(self, version: str, data_version: int, tree: CompiledTree,
+                 leaf_scores: Dict[str, float], result: TreeResult, max_age: float = MAX_AGE_SECONDS):
+        self.version = version
+        self.data_version = data_version
+        self.tree = tree
+        self.leaf_scores = leaf_scores
+        self.result = result
+        self.max_age = max_age
+        self.computed_at = time.monotonic()
+        self._alerts: Optional[List[Dict[str, Any]]] = None
+        self._bodies: Dict[str, bytes] = {}
+
+    def alerts(self) -> List[Dict[str, Any]]:
+        if self._alerts is None:
+            self._alerts = get_all_alerts(self.result)
+        return self._alerts
+
+    def snapshot_body(self, root: str = None, depth: int = None) -> bytes:
+        """Serialized /snapshot body (optionally one subtree), encoded once per evaluation."""
+        key = f"snapshot:{root}:{depth}"
+        body = self._bodies.get(key)
+        if body is None:
+            if root is None and depth is None:
+                body = self.result.snapshot_json()
+            else:
+                root = root or self.tree.node_ids[self.tree.root]
+                body = self.result.snapshot_json(self.tree.subtree(root, depth), self.tree.index[root])
+            self._bodies[key] = body
+        return body
+
+    def alerts_body(self) -> bytes:
+        """Serialized /alerts body, encoded once per evaluation."""
+        body = self._bodies.get("alerts")
+        if body is None:
+            alerts = self.alerts()
+            body = self._bodies["alerts"] = json.dumps(
+                {"total_alerts": len(alerts), "alerts": alerts}, ensure_ascii=False, separators=(",", ":")
+            ).encode()
+        return body
+
+
+class TreeStateCache:
+    def __init__(self, max_age: float = MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self._entry: Optional[CachedTreeState] = None
+        self._data_version = 0
+        self._lock = threading.Lock()           # guards the data version
+        self._compute_lock = threading.Lock()   # single-flight recomputation
+
+    def invalidate(self) -> int:
+        with self._lock:
+            self._data_version += 1
+            return self._data_version
+
+    def peek(self) -> Optional[CachedTreeState]:
+        """The cached entry if it is still fresh, without computing anything."""
+        entry = self._entry
+        if (
+            entry is not None
+            and entry.tree is get_tree()
+            and entry.data_version == self._data_version
+            and time.monotonic() - entry.computed_at < entry.max_age
+        ):
+            return entry
+        return None
+
+    def get(self, db: Session) -> CachedTreeState:
+        entry = self.peek()
+        if entry is not None:
+            return entry
+        with self._compute_lock:
+            # Another caller may have finished the computation while we waited
+            entry = self.peek()
+            if entry is not None:
+                return entry
+            tree = get_tree()
+            data_version = self._data_version
+            leaf_scores = get_current_leaf_scores(db, tree)
+            result = propagate_scores(leaf_scores, tree)
+            return self._install(tree, data_version, leaf_scores, result, self.max_age)
+
+    @property
+    def data_version(self) -> int:
+        return self._data_version
+
+    def publish(self, tree: CompiledTree, data_version: int, leaf_scores: Dict[str, float],
+                result: TreeResult, max_age: float = None) -> CachedTreeState:
+        """
+        Install an evaluation computed elsewhere (the scheduler) as the
+        current state, fresh for ``max_age`` seconds or until invalidated.
+        ``data_version`` is the one read before the evaluation started, so a
+        write that lands mid-evaluation still marks the result stale.
+        """
+        return self._install(tree, data_version, leaf_scores, result, max_age or self.max_age)
+
+    def _install(self, tree, data_version, leaf_scores, result, max_age) -> CachedTreeState:
+        entry = CachedTreeState(content_version(tree, result), data_version, tree, leaf_scores, result, max_age)
+        self._entry = entry
+        return entry
+
+
+tree_state_cache = TreeStateCache()
+
+
+def get_current_tree_state(db: Session) -> CachedTreeState:
+    return tree_state_cache.get(db)
+
+
+def invalidate_tree_state() -> int:
+    return tree_state_cache.invalidate()
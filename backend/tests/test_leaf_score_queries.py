@@ -0,0 +1,50 @@
+"""
+Leaf score reads must cost a fixed number of statements, not one per leaf.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models.db_models import MetricSnapshot
+from services.metric_tree import CompiledTree
+from services.snapshot_store import latest_leaf_scores
+from services.tree_state import get_current_leaf_scores
+
+
+def make_tree(leaf_count: int) -> CompiledTree:
+    definition = {"root": {"label": "Root", "parent": None, "weight": 1.0, "leaf": False}}
+    for i in range(leaf_count):
+        definition[f"leaf_{i}"] = {"label": f"Leaf {i}", "parent": "root", "weight": 1.0, "leaf": True}
+    return CompiledTree(definition)
+
+
+def add_legacy_rows(db, tree: CompiledTree, evaluations: int = 3) -> None:
+    start = datetime(2026, 1, 1)
+    for k in range(evaluations):
+        for leaf_id in tree.leaf_ids:
+            db.add(MetricSnapshot(node_id=leaf_id, score=50.0 + k, evaluated_at=start + timedelta(hours=k)))
+    db.commit()
+
+
+@pytest.mark.parametrize("leaf_count", [5, 50, 200])
+def test_latest_leaf_scores_legacy_rows_constant_queries(db, count_queries, leaf_count):
+    tree = make_tree(leaf_count)
+    add_legacy_rows(db, tree)
+
+    with count_queries() as statements:
+        scores = latest_leaf_scores(db, tree)
+
+    assert scores == {leaf_id: 52.0 for leaf_id in tree.leaf_ids}
+    assert len(statements) == 2  # frame lookup + one grouped legacy query
+
+
+@pytest.mark.parametrize("leaf_count", [5, 50, 200])
+def test_get_current_leaf_scores_constant_queries(db, count_queries, leaf_count):
+    tree = make_tree(leaf_count)
+    add_legacy_rows(db, tree)
+
+    with count_queries() as statements:
+        scores = get_current_leaf_scores(db, tree)
+
+    assert len(scores) == leaf_count
+    assert len(statements) == 2
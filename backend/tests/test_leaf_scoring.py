@@ -0,0 +1,27 @@
+"""
+Live leaf scoring from source tables.
+"""
+from datetime import datetime
+
+from models.db_models import MacroRiskSignal
+from services.leaf_scoring import live_leaf_scores, rescore_leaves
+
+FAB_DOWNTIME = "resilience.early_warning.fab_downtime"
+
+
+def test_macro_leaf_recovers_once_every_signal_is_resolved(db):
+    signal = MacroRiskSignal(signal_type="fab_downtime", affected_region="Taiwan", severity_score=85.0,
+                             signal_date=datetime.utcnow().date(), resolved=False)
+    db.add(signal)
+    db.commit()
+    assert rescore_leaves(db, "macro", [FAB_DOWNTIME]) == {FAB_DOWNTIME: 15.0}
+
+    signal.resolved = True
+    db.commit()
+    # No open signal left: the leaf is scored healthy rather than dropped
+    assert rescore_leaves(db, "macro", [FAB_DOWNTIME]) == {FAB_DOWNTIME: 100.0}
+    assert live_leaf_scores(db)[FAB_DOWNTIME] == 100.0
+
+
+def test_averaged_leaves_without_rows_stay_unscored(db):
+    assert rescore_leaves(db, "inventory", ["resilience.demand_shock.lta_utilization"]) == {}
@@ -1,11 +1,113 @@
 import { useState, useEffect, useRef } from 'react';
 import { fetchSnapshot, fetchAlerts, fetchFullPrediction } from '../api';
 
-// Polls metric tree snapshot every 30s
+const WS_URL = process.env.REACT_APP_WS_URL || 'ws://localhost:8000';
+
+// Query string for /api/simulate/ws/alerts subscription filters:
+// { prefix, min_severity, disruption_types: [...], alerts, deltas }
+function subscriptionQuery(filters = {}) {
+  const params = new URLSearchParams();
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value === undefined || value === null) return;
+    if (Array.isArray(value)) value = value.join(',');
+    if (typeof value === 'boolean') value = value ? '1' : '0';
+    params.set(key, value);
+  });
+  const query = params.toString();
+  return query ? `?${query}` : '';
+}
+
+// Patch a snapshot with a tree delta's changed nodes
+function applyTreeDelta(snapshot, delta) {
+  const changed = new Map(delta.nodes.map(n => [n.node_id, n]));
+  const nodes = snapshot.nodes.map(node => {
+    const update = changed.get(node.node_id);
+    return update
+      ? { ...node, score: update.score, status: update.status, flagged: update.status === 'red' }
+      : node;
+  });
+  const root = changed.get(snapshot.root);
+  return {
+    ...snapshot,
+    nodes,
+    ...(root ? { root_score: root.score, root_status: root.status } : {}),
+  };
+}
+
+// Keeps an alert stream subscription open: reconnects after drops and resumes
+// from the last seen seq, so the server replays what was missed (or sends
+// one snapshot) instead of the dashboard reloading everything over REST.
+// Returns a function that closes the stream.
+function openAlertStream(filters, onMessage) {
+  let ws = null;
+  let retry = null;
+  let closed = false;
+  let resuming = false;
+  let lastSeq = null;
+  let epoch = null;
+
+  const connect = () => {
+    const resume = lastSeq !== null ? { last_seq: lastSeq, epoch } : {};
+    try {
+      ws = new WebSocket(`${WS_URL}/api/simulate/ws/alerts${subscriptionQuery({ ...filters, ...resume })}`);
+    } catch (e) {
+      console.warn('WebSocket not available:', e);
+      return;
+    }
+
+    ws.onmessage = (event) => {
+      let msg;
+      try {
+        msg = JSON.parse(event.data);
+      } catch (e) {
+        console.warn('Could not parse WebSocket message:', e);
+        return;
+      }
+      if (msg.type === 'subscribed') {
+        resuming = false;
+        epoch = msg.data.epoch;
+        lastSeq = msg.data.seq;
+      } else if (msg.seq !== undefined) {
+        if (resuming) return;  // superseded by the replay that follows the ack
+        if (msg.since !== null && msg.since !== lastSeq) {
+          // Messages were dropped on the way: catch up from the last one we have
+          resuming = true;
+          ws.send(JSON.stringify({ type: 'subscribe', ...filters, last_seq: lastSeq, epoch }));
+          return;
+        }
+        lastSeq = msg.seq;
+      }
+      onMessage(msg);
+    };
+
+    ws.onerror = (err) => {
+      console.warn('WebSocket error:', err);
+    };
+
+    ws.onclose = () => {
+      resuming = false;
+      if (!closed) retry = setTimeout(connect, 3000);
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      ws.close();
+    }
+  };
+}
+
+// Metric tree snapshot: polled every 30s, and patched in between from the
+// server's tree deltas (only changed nodes) when the WebSocket is available
 export function useMetricTree(pollInterval = 30000) {
   const [data, setData] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const dataRef = useRef(null);
+  dataRef.current = data;
 
   const load = async () => {
     try {
@@ -26,14 +128,31 @@ export function useMetricTree(pollInterval = 30000) {
     return () => clearInterval(interval);
   }, [pollInterval]);
 
+  useEffect(() => openAlertStream({ alerts: false, deltas: true }, (msg) => {
+    if (msg.type === 'delta') {
+      if (msg.data.reset) {
+        load();  // tree structure changed: start from a fresh snapshot
+      } else {
+        setData(prev => (prev ? applyTreeDelta(prev, msg.data) : prev));
+      }
+    } else if (msg.type === 'snapshot') {
+      const current = dataRef.current;
+      if (current && current.nodes.length === msg.data.nodes.length) {
+        setData(applyTreeDelta(current, msg.data));
+      } else {
+        load();
+      }
+    }
+  }), []);
+
   return { data, loading, error, refetch: load };
 }
 
-// WebSocket-based real-time alert subscription (optional - graceful fallback)
-export function useAlerts() {
+// WebSocket-based real-time alert subscription (optional - graceful fallback).
+// `filters` narrow what the server sends, e.g. { min_severity: 'high' }.
+export function useAlerts(filters = {}) {
   const [alerts, setAlerts] = useState([]);
-  const wsRef = useRef(null);
-  const WS_URL = process.env.REACT_APP_WS_URL || 'ws://localhost:8000';
+  const query = subscriptionQuery(filters);
 
   useEffect(() => {
     // Load initial alerts via HTTP
@@ -44,34 +163,17 @@ export function useAlerts() {
       setAlerts([]);
     });
 
-    // Attempt WebSocket connection (graceful degradation)
-    try {
-      const ws = new WebSocket(`${WS_URL}/ws/alerts`);
-      wsRef.current = ws;
-
-      ws.onmessage = (event) => {
-        try {
-          const alert = JSON.parse(event.data);
-          setAlerts(prev => [alert, ...prev.slice(0, 19)]);
-        } catch (e) {
-          console.warn('Could not parse alert:', e);
-        }
-      };
-
-      ws.onerror = (err) => {
-        console.warn('WebSocket error:', err);
-      };
-
-      return () => {
-        if (ws.readyState === WebSocket.OPEN) {
-          ws.close();
-        }
-      };
-    } catch (e) {
-      console.warn('WebSocket not available:', e);
-      return () => {};
-    }
-  }, [WS_URL]);
+    // Live alerts over WebSocket (graceful degradation)
+    return openAlertStream(filters, (msg) => {
+      if (msg.type === 'alert') {
+        setAlerts(prev => [msg.data, ...prev.slice(0, 19)]);
+      } else if (msg.type === 'snapshot') {
+        setAlerts(msg.data.alerts);
+      } else if (msg.type === 'error') {
+        console.warn('Alert subscription rejected:', msg.data.error);
+      }
+    });
+  }, [query]);
 
   return { alerts };
 }